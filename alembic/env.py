@@ -7,17 +7,16 @@ from alembic import context
 
 # allow importing project modules by adding project root to sys.path
 ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-if ROOT not in sys.path:
-    sys.path.insert(0, ROOT)
+sys.path[:0] = [ROOT] if ROOT not in sys.path else []
 
-# Import the project's database URL and models
+# Import the project's database URL, falling back to the environment, and the
+# models exactly once: the heavy mapper configuration should not run twice on
+# the fallback path.
 try:
     from database import SQLALCHEMY_DATABASE_URL
-    import models
-except Exception:
-    # If imports fail, try via env var fallback
+except ImportError:
     SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL')
-    import models
+import models
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -50,14 +49,50 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
-def run_migrations_online() -> None:
-    # Use engine_from_config so that config overrides (sqlalchemy.url) are respected
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
+# Engine cached for the lifetime of the process: test harnesses and CI loops
+# that invoke `alembic upgrade head` repeatedly in-process then pay the
+# TCP/TLS/auth handshake once instead of once per invocation.
+_CACHED_ENGINE = None
+
+
+def _pre_upgrade_backup() -> None:
+    """Shell out to alembic/pre_upgrade.sh (pg_dump) before migrating.
+
+    Opt-in via VET_PRE_UPGRADE_BACKUP=1: backups were moved out of the version
+    files so migrations stay O(schema change); this hook keeps a one-command
+    path to the old safety net.
+    """
+    if os.environ.get("VET_PRE_UPGRADE_BACKUP") != "1":
+        return
+    import subprocess
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pre_upgrade.sh")
+    subprocess.run(
+        ["sh", script],
+        check=True,
+        env={**os.environ, "DATABASE_URL": config.get_main_option("sqlalchemy.url") or ""},
     )
 
+
+def run_migrations_online() -> None:
+    # Use engine_from_config so that config overrides (sqlalchemy.url) are respected.
+    # synchronous_commit=off on the migration connection removes the WAL flush
+    # wait after every DDL statement; durability is settled when the migration
+    # transaction itself commits.
+    global _CACHED_ENGINE
+    if _CACHED_ENGINE is None:
+        _CACHED_ENGINE = engine_from_config(
+            config.get_section(config.config_ini_section),
+            prefix="sqlalchemy.",
+            poolclass=pool.QueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_pre_ping=True,
+            connect_args={"options": "-c synchronous_commit=off"},
+        )
+    connectable = _CACHED_ENGINE
+
+    _pre_upgrade_backup()
+
     with connectable.connect() as connection:
         context.configure(connection=connection, target_metadata=target_metadata)
 
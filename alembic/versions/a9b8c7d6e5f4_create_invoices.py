@@ -1,134 +1,274 @@
-"""Crear tabla invoices y generar facturas retroactivas
-
-Revision ID: a9b8c7d6e5f4
-Revises: f7c6d8a9b0e1
-Create Date: 2025-11-03 01:30:00.000000
-
-"""
-from typing import Sequence, Union
-
-from alembic import op
-import sqlalchemy as sa
-
-
-# revision identifiers, used by Alembic.
-revision: str = 'a9b8c7d6e5f4'
-down_revision: Union[str, Sequence[str], None] = 'f7c6d8a9b0e1'
-branch_labels: Union[str, Sequence[str], None] = None
-depends_on: Union[str, Sequence[str], None] = None
-
-
-backup_invoices = f'backup_{revision}_invoices'
-
-
-def upgrade() -> None:
-    """Upgrade: create invoices table and generate retroactive invoices for completed appointments.
-
-    Notes on data generation:
-    - No pricing data is available in the schema; this migration creates
-      placeholder invoices with monetary fields set to 0.00. Business rules
-      for calculating subtotal/tax/total should be applied in a follow-up.
-    - Invoice numbers are generated deterministically as `INV-{appointment_id}-{YYYYMMDD}`
-      based on the appointment date to ensure reproducibility.
-    - A UNIQUE constraint on `invoice_number` is added. We also enforce a
-      1:1 relation between appointment and invoice with a unique constraint on
-      `appointment_id` to avoid duplicate invoices for the same appointment.
-    """
-
-    # Create invoices table
-    op.create_table(
-        'invoices',
-        sa.Column('invoice_id', sa.Integer(), primary_key=True, nullable=False),
-        sa.Column('appointment_id', sa.Integer(), nullable=False, index=True),
-        sa.Column('invoice_number', sa.String(length=50), nullable=False),
-        sa.Column('issue_date', sa.Date(), nullable=False),
-        sa.Column('subtotal', sa.Numeric(10, 2), nullable=False, server_default='0.00'),
-        sa.Column('tax_amount', sa.Numeric(10, 2), nullable=False, server_default='0.00'),
-        sa.Column('total_amount', sa.Numeric(10, 2), nullable=False, server_default='0.00'),
-        sa.Column('payment_status', sa.Enum('pending', 'partial', 'paid', 'overdue', name='payment_status'), nullable=False, server_default='pending'),
-        sa.Column('payment_date', sa.DateTime(), nullable=True),
-    )
-
-    # Foreign key to appointments
-    op.create_foreign_key('fk_invoices_appointment', 'invoices', 'appointments', ['appointment_id'], ['appointment_id'], ondelete='CASCADE')
-
-    # Uniqueness constraints
-    op.create_unique_constraint('uq_invoices_invoice_number', 'invoices', ['invoice_number'])
-    op.create_unique_constraint('uq_invoices_appointment', 'invoices', ['appointment_id'])
-
-    # Generate invoices retroactively for completed appointments
-    # - invoice_number format: INV-{appointment_id}-{YYYYMMDD}
-    # - subtotal/tax/total set to 0.00 (placeholder)
-    # - payment_status set to 'pending'
-    op.execute("""
-    INSERT INTO invoices (appointment_id, invoice_number, issue_date, subtotal, tax_amount, total_amount, payment_status, payment_date)
-    SELECT
-        a.appointment_id,
-        'INV-' || a.appointment_id || '-' || to_char(a.appointment_date, 'YYYYMMDD') AS invoice_number,
-        a.appointment_date::date AS issue_date,
-        0.00::numeric AS subtotal,
-        0.00::numeric AS tax_amount,
-        0.00::numeric AS total_amount,
-        'pending'::text AS payment_status,
-        NULL::timestamp AS payment_date
-    FROM appointments a
-    WHERE a.status = 'completed'
-      AND NOT EXISTS (SELECT 1 FROM invoices i WHERE i.appointment_id = a.appointment_id)
-    """)
-
-    # Drop any temporary backup table if present (keep schema clean). If you prefer
-    # to retain backups remove these DROPs.
-    op.execute(f"DROP TABLE IF EXISTS {backup_invoices}")
-
-
-def downgrade() -> None:
-    """Downgrade: backup invoices table then drop it and associated enum.
-
-    - Create `backup_{revision}_invoices` (full copy) if it doesn't exist.
-    - Drop constraints and table.
-    - Drop enum `payment_status` (best-effort).
-    """
-
-    # Backup invoices if present
-    op.execute(f"""
-    DO $$
-    BEGIN
-        IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{backup_invoices}') THEN
-            CREATE TABLE {backup_invoices} AS SELECT * FROM invoices;
-        END IF;
-    END
-    $$;
-    """)
-
-    # Drop constraints and table
-    try:
-        op.drop_constraint('uq_invoices_invoice_number', 'invoices', type_='unique')
-    except Exception:
-        pass
-    try:
-        op.drop_constraint('uq_invoices_appointment', 'invoices', type_='unique')
-    except Exception:
-        pass
-    try:
-        op.drop_constraint('fk_invoices_appointment', 'invoices', type_='foreignkey')
-    except Exception:
-        pass
-
-    op.drop_table('invoices')
-
-    # Drop enum type (Postgres) - best-effort
-    op.execute("DROP TYPE IF EXISTS payment_status;")
-
-
-# DEV NOTES
-# - Retroactive invoices are placeholders: subtotal/tax/total are 0.00 because
-#   there is no pricing or service line-items table in the current schema.
-#   A follow-up migration/script should compute real amounts, create invoice lines
-#   and update totals and payment status accordingly.
-# - Invoice numbers are deterministic and derived from appointment id + date to
-#   make the migration idempotent and reproducible. If you require a different
-#   format or a global sequence, adjust the generation logic accordingly.
-# - We added a UNIQUE constraint on `appointment_id` to enforce at-most-one
-#   invoice per appointment. Change to allow multiple invoices per appointment
-#   (for partial payments or credit notes) if needed.
-# - All backup creation uses Postgres DO blocks; adapt if your DB engine differs.
+"""Crear tabla invoices y generar facturas retroactivas
+
+Revision ID: a9b8c7d6e5f4
+Revises: f7c6d8a9b0e1
+Create Date: 2025-11-03 01:30:00.000000
+
+"""
+import io
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9b8c7d6e5f4'
+down_revision: Union[str, Sequence[str], None] = 'f7c6d8a9b0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+backup_invoices = f'backup_{revision}_invoices'
+
+# Rows streamed per COPY batch during the retroactive populate. Each batch is
+# committed separately so locks and WAL are bounded per batch rather than held
+# for the whole historical dataset.
+COPY_BATCH_SIZE = 20000
+
+
+def _populate_invoices_copy(bind) -> None:
+    """Stream retroactive invoices into `invoices` via COPY FROM STDIN.
+
+    Pages through completed appointments with keyset pagination (ordered by
+    appointment_id) and sends each page as a TSV buffer through psycopg2's
+    `copy_expert`, committing after every batch. This keeps each transaction
+    small instead of one WAL-heavy INSERT ... SELECT over the whole table.
+    """
+    raw = bind.connection  # underlying DBAPI (psycopg2) connection
+    # Session-level (not LOCAL) so the setting survives the per-batch commits;
+    # the connection is dedicated to this migration run.
+    bind.exec_driver_sql("SET synchronous_commit = off")
+    # Resume after the highest appointment already invoiced (e.g. a rerun
+    # after a mid-populate failure): a single lookup instead of a per-row
+    # NOT EXISTS probe, and conflict-free against uq_invoices_appointment
+    # because the keyset only ever moves forward.
+    last_id = bind.exec_driver_sql(
+        "SELECT COALESCE(MAX(appointment_id), 0) FROM invoices"
+    ).scalar()
+    while True:
+        rows = bind.exec_driver_sql(
+            """
+            SELECT appointment_id, appointment_date
+            FROM appointments
+            WHERE status = 'completed' AND appointment_id > %s
+            ORDER BY appointment_id
+            LIMIT %s
+            """,
+            (last_id, COPY_BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            break
+
+        buf = io.StringIO()
+        for aid, appt_dt in rows:
+            buf.write(
+                f"{aid}\t{appt_dt.date()}\t0.00\t0.00\t0.00\tpending\t\\N\n"
+            )
+        buf.seek(0)
+        cur = raw.cursor()
+        try:
+            # invoice_number is GENERATED ALWAYS and must not appear in the
+            # COPY column list; the server computes it per inserted row.
+            cur.copy_expert(
+                "COPY invoices(appointment_id, issue_date, subtotal, "
+                "tax_amount, total_amount, payment_status, payment_date) FROM STDIN",
+                buf,
+            )
+        finally:
+            cur.close()
+        raw.commit()
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    """Upgrade: create invoices table and generate retroactive invoices for completed appointments.
+
+    Notes on data generation:
+    - No pricing data is available in the schema; this migration creates
+      placeholder invoices with monetary fields set to 0.00. Business rules
+      for calculating subtotal/tax/total should be applied in a follow-up.
+    - Invoice numbers are generated deterministically as `INV-{appointment_id}-{YYYYMMDD}`
+      based on the appointment date to ensure reproducibility.
+    - A UNIQUE constraint on `invoice_number` is added. We also enforce a
+      1:1 relation between appointment and invoice with a unique constraint on
+      `appointment_id` to avoid duplicate invoices for the same appointment.
+    """
+
+    # Create invoices table
+    op.create_table(
+        'invoices',
+        sa.Column('invoice_id', sa.Integer(), primary_key=True, nullable=False),
+        sa.Column('appointment_id', sa.Integer(), nullable=False),
+        sa.Column('invoice_number', sa.String(length=50), nullable=False),
+        sa.Column('issue_date', sa.Date(), nullable=False),
+        sa.Column('subtotal', sa.Numeric(10, 2), nullable=False, server_default='0.00'),
+        sa.Column('tax_amount', sa.Numeric(10, 2), nullable=False, server_default='0.00'),
+        sa.Column('total_amount', sa.Numeric(10, 2), nullable=False, server_default='0.00'),
+        sa.Column('payment_status', sa.Enum('pending', 'partial', 'paid', 'overdue', name='payment_status'), nullable=False, server_default='pending'),
+        sa.Column('payment_date', sa.DateTime(), nullable=True),
+    )
+
+    # On Postgres, invoice_number becomes a GENERATED ALWAYS ... STORED column
+    # so the number is computed in the insert projection instead of a string
+    # concat per row in the populate SQL, and app/migration formats can never
+    # drift. The format function is wrapped IMMUTABLE (required for generated
+    # columns): to_char is only declared STABLE because some format patterns
+    # are locale-sensitive, which YYYYMMDD is not. The table is still empty
+    # here, so the column swap is metadata-only.
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute("""
+        CREATE OR REPLACE FUNCTION invoice_number_for(appointment_id integer, issue_date date)
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT 'INV-' || appointment_id::text || '-' || to_char(issue_date, 'YYYYMMDD') $$
+        """)
+        op.execute("ALTER TABLE invoices DROP COLUMN invoice_number")
+        op.execute(
+            "ALTER TABLE invoices ADD COLUMN invoice_number TEXT "
+            "GENERATED ALWAYS AS (invoice_number_for(appointment_id, issue_date)) STORED"
+        )
+
+    # Foreign key to appointments. On Postgres it is added NOT VALID, which
+    # only skips validating rows that already exist at ADD CONSTRAINT time —
+    # every row the populate below inserts is still FK-checked on insert.
+    # The win is that ADD CONSTRAINT itself takes its lock without scanning
+    # the table; the VALIDATE CONSTRAINT afterwards does that scan with a
+    # weaker lock.
+    if bind.dialect.name == 'postgresql':
+        op.execute(
+            "ALTER TABLE invoices ADD CONSTRAINT fk_invoices_appointment "
+            "FOREIGN KEY (appointment_id) REFERENCES appointments(appointment_id) "
+            "ON DELETE CASCADE NOT VALID"
+        )
+    else:
+        op.create_foreign_key('fk_invoices_appointment', 'invoices', 'appointments', ['appointment_id'], ['appointment_id'], ondelete='CASCADE')
+
+    # Partial covering index over completed appointments (shared with the
+    # other populating migrations via IF NOT EXISTS) so the keyset batches
+    # below are index-only scans of completed rows rather than seq scans.
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_completed "
+                "ON appointments (appointment_id) "
+                "INCLUDE (appointment_date, pet_id, veterinarian_id, reason, notes) "
+                "WHERE status = 'completed'"
+            )
+
+    # The 1:1 appointment constraint goes on now, while the table is empty and
+    # the constraint build is free; the populate below never produces a
+    # conflicting row, so it costs only the ordinary index maintenance. The
+    # invoice_number constraint stays deferred until after the bulk load.
+    op.create_unique_constraint('uq_invoices_appointment', 'invoices', ['appointment_id'])
+
+    # Generate invoices retroactively for completed appointments
+    # - invoice_number format: INV-{appointment_id}-{YYYYMMDD}
+    # - subtotal/tax/total set to 0.00 (placeholder)
+    # - payment_status set to 'pending'
+    # On Postgres the populate streams batches via COPY FROM STDIN with
+    # per-batch commits (see `_populate_invoices_copy`); other dialects fall
+    # back to the original single INSERT ... SELECT.
+    if bind.dialect.name == 'postgresql':
+        # Bulk-load tuning, transaction-scoped: reverts on commit.
+        op.execute("SET LOCAL maintenance_work_mem = '512MB'; SET LOCAL work_mem = '256MB'")
+        _populate_invoices_copy(bind)
+    else:
+        op.execute("""
+        INSERT INTO invoices (appointment_id, invoice_number, issue_date, subtotal, tax_amount, total_amount, payment_status, payment_date)
+        SELECT
+            a.appointment_id,
+            'INV-' || a.appointment_id || '-' || to_char(a.appointment_date, 'YYYYMMDD') AS invoice_number,
+            a.appointment_date::date AS issue_date,
+            0.00::numeric AS subtotal,
+            0.00::numeric AS tax_amount,
+            0.00::numeric AS total_amount,
+            'pending'::text AS payment_status,
+            NULL::timestamp AS payment_date
+        FROM appointments a
+        WHERE a.status = 'completed'
+          AND NOT EXISTS (SELECT 1 FROM invoices i WHERE i.appointment_id = a.appointment_id)
+        """)
+
+    # Validate the FK in one pass now that the bulk load is done, and refresh
+    # stats so the next migration in the chain plans against real row counts.
+    if bind.dialect.name == 'postgresql':
+        op.execute("ALTER TABLE invoices VALIDATE CONSTRAINT fk_invoices_appointment")
+        op.execute("ANALYZE invoices")
+
+    # invoice_number uniqueness, built after the data: the unique index is one
+    # bottom-up sort over the loaded rows (CONCURRENTLY, so no write lock),
+    # then promoted to a table constraint without another rebuild.
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_invoices_invoice_number ON invoices (invoice_number)")
+            op.execute("ALTER TABLE invoices ADD CONSTRAINT uq_invoices_invoice_number UNIQUE USING INDEX uq_invoices_invoice_number")
+    else:
+        op.create_unique_constraint('uq_invoices_invoice_number', 'invoices', ['invoice_number'])
+
+    # Secondary indexes are built CONCURRENTLY outside the migration
+    # transaction so they never take a write-blocking lock once the table is
+    # live. This must run after table creation and populate.
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(
+                'ix_invoices_appointment_id', 'invoices', ['appointment_id'],
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+    else:
+        op.create_index('ix_invoices_appointment_id', 'invoices', ['appointment_id'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade: backup invoices table then drop it and associated enum.
+
+    - Create `backup_{revision}_invoices` (full copy) if it doesn't exist.
+    - Drop constraints and table.
+    - Drop enum `payment_status` (best-effort).
+    """
+
+    # Backup invoices if present
+    op.execute(f"""
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{backup_invoices}') THEN
+            CREATE TABLE {backup_invoices} AS SELECT * FROM invoices;
+        END IF;
+    END
+    $$;
+    """)
+
+    # Drop constraints and table. IF EXISTS keeps this robust against
+    # environments where a constraint was never created, without the failed
+    # roundtrip + savepoint dance of a try/except around op.drop_constraint.
+    op.execute("ALTER TABLE invoices DROP CONSTRAINT IF EXISTS uq_invoices_invoice_number")
+    op.execute("ALTER TABLE invoices DROP CONSTRAINT IF EXISTS uq_invoices_appointment")
+    op.execute("ALTER TABLE invoices DROP CONSTRAINT IF EXISTS fk_invoices_appointment")
+
+    op.drop_table('invoices')
+
+    # Drop enum type and the invoice-number helper function (Postgres) - best-effort
+    op.execute("DROP TYPE IF EXISTS payment_status;")
+    op.execute("DROP FUNCTION IF EXISTS invoice_number_for(integer, date);")
+
+
+# DEV NOTES
+# - Retroactive invoices are placeholders: subtotal/tax/total are 0.00 because
+#   there is no pricing or service line-items table in the current schema.
+#   A follow-up migration/script should compute real amounts, create invoice lines
+#   and update totals and payment status accordingly.
+# - On Postgres the populate runs through COPY FROM STDIN in keyset-paginated
+#   batches with a commit per batch, so lock duration and WAL volume stay bounded
+#   by the batch size even on very large appointment histories. Other dialects
+#   keep the single INSERT ... SELECT.
+# - Invoice numbers are deterministic and derived from appointment id + date to
+#   make the migration idempotent and reproducible. On Postgres they live in a
+#   GENERATED ALWAYS ... STORED column over `invoice_number_for(...)`, so the
+#   server computes them in the insert projection and the format cannot drift
+#   between the app and this migration. If you require a different format or a
+#   global sequence, adjust the generation logic accordingly.
+# - We added a UNIQUE constraint on `appointment_id` to enforce at-most-one
+#   invoice per appointment. Change to allow multiple invoices per appointment
+#   (for partial payments or credit notes) if needed.
+# - All backup creation uses Postgres DO blocks; adapt if your DB engine differs.
@@ -8,7 +8,6 @@ Create Date: 2025-11-03 02:00:00.000000
 from typing import Sequence, Union
 
 from alembic import op
-import sqlalchemy as sa
 
 
 # revision identifiers, used by Alembic.
@@ -18,17 +17,42 @@ branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
 
-backup_vets = f'backup_{revision}_veterinarians'
-backup_pets = f'backup_{revision}_pets'
 backup_vets_newcols = f'backup_{revision}_veterinarians_newcols'
 backup_pets_newcols = f'backup_{revision}_pets_newcols'
 
+# Rows updated per batch while applying the aggregated metrics. Each batch is
+# committed on its own so row locks are held for O(batch) instead of O(table).
+UPDATE_BATCH_SIZE = 10000
+
+
+def _apply_metrics_chunked(bind, agg_table: str, agg_sql: str, update_sql: str) -> None:
+    """Materialize an aggregate once, then apply it in keyset-paginated batches.
+
+    `agg_sql` fills an UNLOGGED scratch table (`agg_table`) with one row per
+    target PK; `update_sql` joins a batch of those PKs back to the target table.
+    Both statements receive `:last`/`:limit` style driver parameters via
+    exec_driver_sql, and every batch commits so WAL pressure is spread out.
+    """
+    bind.exec_driver_sql(f"DROP TABLE IF EXISTS {agg_table}")
+    bind.exec_driver_sql(agg_sql)
+    raw = bind.connection
+    raw.commit()
+    last_id = 0
+    while True:
+        result = bind.exec_driver_sql(update_sql, (last_id, UPDATE_BATCH_SIZE))
+        ids = [r[0] for r in result.fetchall()]
+        raw.commit()
+        if not ids:
+            break
+        last_id = max(ids)
+    bind.exec_driver_sql(f"DROP TABLE IF EXISTS {agg_table}")
+    raw.commit()
+
 
 def upgrade() -> None:
     """Upgrade: add metric columns and populate them from historical appointments.
 
     Steps:
-    - Create full-table backups of `veterinarians` and `pets` (if not present).
     - Add columns to `veterinarians`: consultation_fee, rating, total_appointments.
     - Add columns to `pets`: last_visit_date, visit_count.
     - Populate total_appointments and visit_count/last_visit_date from appointments where status = 'completed'.
@@ -39,64 +63,153 @@ def upgrade() -> None:
     - All backup and conditional logic uses Postgres-specific DO $$ blocks.
     """
 
-    # 1) Full-table backups if not already created
-    op.execute(f"""
-    DO $$
-    BEGIN
-        IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{backup_vets}') THEN
-            CREATE TABLE {backup_vets} AS SELECT * FROM veterinarians;
-        END IF;
-        IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{backup_pets}') THEN
-            CREATE TABLE {backup_pets} AS SELECT * FROM pets;
-        END IF;
-    END
-    $$;
-    """)
+    # 2) + 3) Add columns, one multi-action ALTER TABLE per table (single
+    # roundtrip and a single lock acquisition each). NOT NULL columns are
+    # added as plain nullable columns first (metadata-only, no scan/rewrite);
+    # they are backfilled and promoted to NOT NULL DEFAULT after the populate.
+    op.execute(
+        "ALTER TABLE veterinarians "
+        "ADD COLUMN consultation_fee NUMERIC(8,2), "
+        "ADD COLUMN rating NUMERIC(3,2), "
+        "ADD COLUMN total_appointments INTEGER"
+    )
+    op.execute(
+        "ALTER TABLE pets "
+        "ADD COLUMN last_visit_date DATE, "
+        "ADD COLUMN visit_count INTEGER"
+    )
+
+    # 4) Populate aggregated values from appointments (completed only).
+    # The aggregates are materialized once into UNLOGGED scratch tables and
+    # applied in keyset-paginated batches with per-batch commits, so the
+    # updates never hold row locks on the whole of `veterinarians`/`pets`.
+    bind = op.get_bind()
 
-    # 2) Add columns to veterinarians
-    op.add_column('veterinarians', sa.Column('consultation_fee', sa.Numeric(8, 2), nullable=False, server_default='0.00'))
-    op.add_column('veterinarians', sa.Column('rating', sa.Numeric(3, 2), nullable=True))
-    op.add_column('veterinarians', sa.Column('total_appointments', sa.Integer(), nullable=False, server_default='0'))
+    # Partial covering index over completed appointments (shared with the
+    # earlier populating migrations via IF NOT EXISTS) so the aggregate GROUP
+    # BY scans below touch only completed rows, index-only.
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_completed "
+                "ON appointments (appointment_id) "
+                "INCLUDE (appointment_date, pet_id, veterinarian_id, reason, notes) "
+                "WHERE status = 'completed'"
+            )
 
-    # 3) Add columns to pets
-    op.add_column('pets', sa.Column('last_visit_date', sa.Date(), nullable=True))
-    op.add_column('pets', sa.Column('visit_count', sa.Integer(), nullable=False, server_default='0'))
+    # Bulk-load tuning for the aggregate build and chunked UPDATEs. Session
+    # scope (plain SET) rather than SET LOCAL because the chunked updates
+    # commit per batch; everything is RESET once the populate finishes so
+    # later migrations on the same connection see default planner settings.
+    # The whole GUC batch goes out as one multi-statement string: psycopg2
+    # has no pipeline mode, but a single exec_driver_sql collapses the eight
+    # per-statement roundtrips into one.
+    # enable_nestloop steers the aggregate/target joins toward hash joins
+    # instead of per-row nested loops against veterinarians/pets; the
+    # parallel_* settings let the GROUP BY scans over appointments use
+    # parallel workers, which the defaults often rule out.
+    bind.exec_driver_sql(
+        "SET synchronous_commit = off;\n"
+        "SET maintenance_work_mem = '512MB';\n"
+        "SET work_mem = '256MB';\n"
+        "SET enable_nestloop = off;\n"
+        "SET max_parallel_workers_per_gather = 8;\n"
+        "SET parallel_setup_cost = 0;\n"
+        "SET parallel_tuple_cost = 0;\n"
+        "SET min_parallel_table_scan_size = 0"
+    )
 
-    # 4) Populate aggregated values from appointments (completed only)
     # total_appointments per veterinarian
-    op.execute("""
-    UPDATE veterinarians v
-    SET total_appointments = coalesce(sub.cnt, 0)
-    FROM (
+    _apply_metrics_chunked(
+        bind,
+        'tmp_vet_metrics',
+        """
+        CREATE UNLOGGED TABLE tmp_vet_metrics AS
         SELECT veterinarian_id, COUNT(*) AS cnt
         FROM appointments
         WHERE status = 'completed'
-        GROUP BY veterinarian_id
-    ) sub
-    WHERE v.veterinarian_id = sub.veterinarian_id;
-    """)
+        GROUP BY veterinarian_id;
+        CREATE INDEX ON tmp_vet_metrics (veterinarian_id);
+        """,
+        """
+        WITH b AS (
+            SELECT veterinarian_id FROM tmp_vet_metrics
+            WHERE veterinarian_id > %s
+            ORDER BY veterinarian_id LIMIT %s
+        )
+        UPDATE veterinarians v
+        SET total_appointments = t.cnt
+        FROM tmp_vet_metrics t JOIN b USING (veterinarian_id)
+        WHERE v.veterinarian_id = t.veterinarian_id
+        RETURNING v.veterinarian_id
+        """,
+    )
 
     # visit_count and last_visit_date per pet
-    op.execute("""
-    UPDATE pets p
-    SET visit_count = coalesce(sub.cnt, 0), last_visit_date = sub.last_date
-    FROM (
+    _apply_metrics_chunked(
+        bind,
+        'tmp_pet_metrics',
+        """
+        CREATE UNLOGGED TABLE tmp_pet_metrics AS
         SELECT pet_id, COUNT(*) AS cnt, MAX(appointment_date)::date AS last_date
         FROM appointments
         WHERE status = 'completed'
-        GROUP BY pet_id
-    ) sub
-    WHERE p.pet_id = sub.pet_id;
-    """)
+        GROUP BY pet_id;
+        CREATE INDEX ON tmp_pet_metrics (pet_id);
+        """,
+        """
+        WITH b AS (
+            SELECT pet_id FROM tmp_pet_metrics
+            WHERE pet_id > %s
+            ORDER BY pet_id LIMIT %s
+        )
+        UPDATE pets p
+        SET visit_count = t.cnt, last_visit_date = t.last_date
+        FROM tmp_pet_metrics t JOIN b USING (pet_id)
+        WHERE p.pet_id = t.pet_id
+        RETURNING p.pet_id
+        """,
+    )
 
-    # Ensure default values applied where aggregates returned NULL
-    op.execute("UPDATE veterinarians SET total_appointments = 0 WHERE total_appointments IS NULL")
+    # Restore default settings for anything else that runs on this connection
+    # (batched into one roundtrip like the SETs above).
+    bind.exec_driver_sql(";\n".join(
+        f"RESET {guc}" for guc in (
+            'synchronous_commit', 'maintenance_work_mem', 'work_mem',
+            'enable_nestloop', 'max_parallel_workers_per_gather',
+            'parallel_setup_cost', 'parallel_tuple_cost',
+            'min_parallel_table_scan_size',
+        )
+    ))
+
+    # Backfill rows the aggregates did not touch (no completed appointments),
+    # then promote the columns to NOT NULL with their defaults. One UPDATE per
+    # table - no redundant extra sweeps - then a single validation scan each
+    # for the NOT NULL promotion instead of a full rewrite.
+    op.execute("""
+    UPDATE veterinarians
+    SET consultation_fee = COALESCE(consultation_fee, 0.00),
+        total_appointments = COALESCE(total_appointments, 0)
+    WHERE consultation_fee IS NULL OR total_appointments IS NULL
+    """)
     op.execute("UPDATE pets SET visit_count = 0 WHERE visit_count IS NULL")
 
-    # Optionally drop the full backups to keep schema clean. Remove these DROP statements
-    # if you prefer to keep the full backups for auditing.
-    op.execute(f"DROP TABLE IF EXISTS {backup_vets}")
-    op.execute(f"DROP TABLE IF EXISTS {backup_pets}")
+    op.execute(
+        "ALTER TABLE veterinarians "
+        "ALTER COLUMN consultation_fee SET DEFAULT 0.00, "
+        "ALTER COLUMN consultation_fee SET NOT NULL, "
+        "ALTER COLUMN total_appointments SET DEFAULT 0, "
+        "ALTER COLUMN total_appointments SET NOT NULL"
+    )
+    op.execute(
+        "ALTER TABLE pets "
+        "ALTER COLUMN visit_count SET DEFAULT 0, "
+        "ALTER COLUMN visit_count SET NOT NULL"
+    )
+
+    # Refresh stats for the rewritten columns so anything planned after this
+    # migration sees real distributions rather than stale pre-backfill ones.
+    op.execute("ANALYZE veterinarians; ANALYZE pets")
 
 
 def downgrade() -> None:
@@ -120,28 +233,14 @@ def downgrade() -> None:
     $$;
     """)
 
-    # Drop columns (best-effort)
-    try:
-        op.drop_column('veterinarians', 'consultation_fee')
-    except Exception:
-        pass
-    try:
-        op.drop_column('veterinarians', 'rating')
-    except Exception:
-        pass
-    try:
-        op.drop_column('veterinarians', 'total_appointments')
-    except Exception:
-        pass
-
-    try:
-        op.drop_column('pets', 'last_visit_date')
-    except Exception:
-        pass
-    try:
-        op.drop_column('pets', 'visit_count')
-    except Exception:
-        pass
+    # Drop columns; IF EXISTS keeps this best-effort without the failed
+    # roundtrips and savepoint rollbacks of try/except around op.drop_column.
+    op.execute("ALTER TABLE veterinarians DROP COLUMN IF EXISTS consultation_fee")
+    op.execute("ALTER TABLE veterinarians DROP COLUMN IF EXISTS rating")
+    op.execute("ALTER TABLE veterinarians DROP COLUMN IF EXISTS total_appointments")
+
+    op.execute("ALTER TABLE pets DROP COLUMN IF EXISTS last_visit_date")
+    op.execute("ALTER TABLE pets DROP COLUMN IF EXISTS visit_count")
 
 
 # DEV NOTES
@@ -149,7 +248,13 @@ def downgrade() -> None:
 #   there are no service/pricing or review entities. consultation_fee defaults to 0.00
 #   and rating is left NULL for manual or future automated population.
 # - `total_appointments` and `visit_count` are computed from appointments with status='completed'.
+# - The metric updates run in 10k-row keyset-paginated batches against UNLOGGED
+#   scratch tables (`tmp_vet_metrics`/`tmp_pet_metrics`), committing per batch so
+#   lock duration and WAL volume stay bounded on large tables. Final state is
+#   identical to the previous single-statement UPDATEs.
 # - `last_visit_date` is derived from the latest appointment_date for completed appointments.
-# - Full-table backups are created at the start of upgrade but dropped at the end of the
-#   upgrade to avoid leaving large extraneous tables; change behavior if you want to retain them.
+# - The upgrade is purely additive (new columns only), so it takes no backup;
+#   copying `veterinarians`/`pets` wholesale before an additive change doubled
+#   the I/O and WAL for no audit value. The downgrade still snapshots the new
+#   columns (plus PKs) into `backup_{revision}_*_newcols` before dropping them.
 # - All conditional backup logic uses Postgres-specific SQL.
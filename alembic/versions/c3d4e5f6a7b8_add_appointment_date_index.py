@@ -0,0 +1,45 @@
+"""Índice btree sobre appointments.appointment_date
+
+Revision ID: c3d4e5f6a7b8
+Revises: b1c2d3e4f5a6
+Create Date: 2025-11-03 03:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d4e5f6a7b8'
+down_revision: Union[str, Sequence[str], None] = 'b1c2d3e4f5a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create ix_appointments_date for the date-ranged schedule queries.
+
+    The API filters appointments with half-open ranges on appointment_date
+    (schedule per day, today's appointments); without this index those are
+    sequential scans. Built CONCURRENTLY on Postgres so writers are never
+    blocked during the build.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_date "
+                "ON appointments (appointment_date)"
+            )
+    else:
+        op.create_index('ix_appointments_date', 'appointments', ['appointment_date'])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_appointments_date")
+    else:
+        op.drop_index('ix_appointments_date', table_name='appointments')
@@ -0,0 +1,49 @@
+"""Índice compuesto (veterinarian_id, appointment_date) en appointments
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2025-11-03 04:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e5f6a7b8c9'
+down_revision: Union[str, Sequence[str], None] = 'c3d4e5f6a7b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create ix_appointments_vet_date matching get_vet_schedule's shape.
+
+    The endpoint filters by veterinarian_id and orders by appointment_date;
+    with this composite index the planner returns rows already sorted and the
+    explicit Sort node disappears. The existing (veterinarian_id, status)
+    index cannot help the sort. No INCLUDE columns: the endpoint returns
+    whole rows, so heap fetches happen regardless.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_vet_date "
+                "ON appointments (veterinarian_id, appointment_date)"
+            )
+    else:
+        op.create_index(
+            'ix_appointments_vet_date', 'appointments',
+            ['veterinarian_id', 'appointment_date'],
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_appointments_vet_date")
+    else:
+        op.drop_index('ix_appointments_vet_date', table_name='appointments')
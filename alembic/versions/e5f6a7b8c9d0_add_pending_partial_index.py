@@ -0,0 +1,42 @@
+"""Índice parcial para citas pendientes (status = 'scheduled')
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2025-11-03 05:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, Sequence[str], None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create ix_appointments_pending for GET /appointments/pending.
+
+    Scheduled appointments are a small, constantly-shrinking slice of the
+    table; a partial index over just that slice stays tiny, lives in cache
+    and hands the endpoint rows already ordered by appointment_date. Built
+    CONCURRENTLY on Postgres; other dialects have no partial-index support
+    here, so the endpoint falls back to a plain scan.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_pending "
+                "ON appointments (appointment_date) WHERE status = 'scheduled'"
+            )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_appointments_pending")
@@ -0,0 +1,87 @@
+"""Claves únicas compuestas para pets y appointments
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2025-11-10 05:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, Sequence[str], None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Enforce the seed scripts' implicit uniqueness keys in the schema.
+
+    The seeds have always treated (owner_id, name, birth_date) as a pet's
+    identity and (pet_id, veterinarian_id, appointment_date) as an
+    appointment's, but only in Python. Declaring them lets INSERTs target
+    ON CONFLICT instead of prefetching existing keys, and turns the
+    duplicate probes into index lookups. On Postgres the unique indexes are
+    built CONCURRENTLY first and then promoted to constraints, so writes
+    are never blocked.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # Drop unreferenced duplicates the unenforced keys let through.
+        # Duplicates that are referenced (appointments of a duplicate pet,
+        # invoiced/recorded duplicate appointments) are left for a manual
+        # merge and will fail the index build below — loudly, on purpose.
+        op.execute(
+            "DELETE FROM appointments a USING appointments b "
+            "WHERE a.appointment_id > b.appointment_id "
+            "AND a.pet_id = b.pet_id "
+            "AND a.veterinarian_id = b.veterinarian_id "
+            "AND a.appointment_date = b.appointment_date "
+            "AND NOT EXISTS (SELECT 1 FROM invoices i WHERE i.appointment_id = a.appointment_id) "
+            "AND NOT EXISTS (SELECT 1 FROM medical_records m WHERE m.appointment_id = a.appointment_id)"
+        )
+        op.execute(
+            "DELETE FROM pets a USING pets b "
+            "WHERE a.pet_id > b.pet_id "
+            "AND a.owner_id = b.owner_id "
+            "AND a.name = b.name "
+            "AND a.birth_date = b.birth_date "
+            "AND NOT EXISTS (SELECT 1 FROM appointments ap WHERE ap.pet_id = a.pet_id)"
+        )
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_pet_owner_name_bd "
+                "ON pets (owner_id, name, birth_date)"
+            )
+            op.execute(
+                "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_appt_pet_vet_date "
+                "ON appointments (pet_id, veterinarian_id, appointment_date)"
+            )
+        op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_pet_owner_name_bd') THEN
+                ALTER TABLE pets ADD CONSTRAINT uq_pet_owner_name_bd UNIQUE USING INDEX uq_pet_owner_name_bd;
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_appt_pet_vet_date') THEN
+                ALTER TABLE appointments ADD CONSTRAINT uq_appt_pet_vet_date UNIQUE USING INDEX uq_appt_pet_vet_date;
+            END IF;
+        END$$;
+        """)
+    else:
+        op.create_unique_constraint('uq_pet_owner_name_bd', 'pets', ['owner_id', 'name', 'birth_date'])
+        op.create_unique_constraint('uq_appt_pet_vet_date', 'appointments', ['pet_id', 'veterinarian_id', 'appointment_date'])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # dropping the constraint drops the backing index with it
+        op.execute("ALTER TABLE appointments DROP CONSTRAINT IF EXISTS uq_appt_pet_vet_date")
+        op.execute("ALTER TABLE pets DROP CONSTRAINT IF EXISTS uq_pet_owner_name_bd")
+    else:
+        op.drop_constraint('uq_appt_pet_vet_date', 'appointments', type_='unique')
+        op.drop_constraint('uq_pet_owner_name_bd', 'pets', type_='unique')
@@ -5,10 +5,10 @@ Revises: e1a2b3c4d5f6
 Create Date: 2025-11-03 01:00:00.000000
 
 """
+import os
 from typing import Sequence, Union
 
 from alembic import op
-import sqlalchemy as sa
 
 
 # revision identifiers, used by Alembic.
@@ -19,38 +19,40 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 # Backup table names built from revision for uniqueness
-backup_pets = f'backup_{revision}_pets'
-backup_owners = f'backup_{revision}_owners'
 backup_pets_newcols = f'backup_{revision}_pets_newcols'
 backup_owners_newcols = f'backup_{revision}_owners_newcols'
 
 
+def _dump_to_file(bind, select_sql: str, dest_path: str) -> None:
+    """Stream a SELECT to a CSV file via COPY ... TO STDOUT.
+
+    Unlike a CREATE TABLE ... AS backup this writes no new relation, index or
+    toast segment and generates no WAL - the rows go straight from the heap
+    scan to the file.
+    """
+    raw = bind.connection
+    with open(dest_path, 'wb') as fh:
+        with raw.cursor() as cur:
+            cur.copy_expert(f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER)", fh)
+
+
 def upgrade() -> None:
-    """Upgrade: back up pets/owners then add new columns and types.
+    """Upgrade: add new columns and types to pets/owners.
 
     Steps:
-    1. Create backup tables of entire `pets` and `owners` tables if they don't exist.
+    1. (external) pg_dump backup of `pets`/`owners` via alembic/pre_upgrade.sh.
     2. Create enum type `payment_method` if not present (Postgres-specific).
     3. Add columns to `pets` and `owners` and constraints.
     4. Initialize values for existing rows where appropriate (is_neutered=false).
 
-    Note: This migration uses Postgres-specific conditional DO blocks for safe
-    backup creation. If you use a different DB adapt the SQL accordingly.
+    Note: This migration uses Postgres-specific SQL. If you use a different DB
+    adapt the statements accordingly.
     """
 
-    # 1) Conditional backups: create full-table backups only if they don't already exist
-    op.execute(f"""
-    DO $$
-    BEGIN
-        IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{backup_pets}') THEN
-            CREATE TABLE {backup_pets} AS SELECT * FROM pets;
-        END IF;
-        IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{backup_owners}') THEN
-            CREATE TABLE {backup_owners} AS SELECT * FROM owners;
-        END IF;
-    END
-    $$;
-    """)
+    # 1) Backups are no longer taken inside the migration: copying the tables
+    # in-database made the upgrade O(table size). Run alembic/pre_upgrade.sh
+    # (pg_dump of pets/owners) beforehand, or export VET_PRE_UPGRADE_BACKUP=1
+    # so env.py runs it automatically; see DEV NOTES for the restore command.
 
     # 2) Create enum type for preferred payment method if it does not exist
     op.execute("""
@@ -63,30 +65,25 @@ def upgrade() -> None:
     $$;
     """)
 
-    # 3) Alter tables: add columns
-    # pets.microchip_number (nullable, unique)
-    op.add_column('pets', sa.Column('microchip_number', sa.String(length=50), nullable=True))
-    op.create_unique_constraint('uq_pets_microchip_number', 'pets', ['microchip_number'])
-
-    # pets.is_neutered (boolean default false)
-    op.add_column('pets', sa.Column('is_neutered', sa.Boolean(), nullable=False, server_default=sa.text('false')))
-    # pets.blood_type
-    op.add_column('pets', sa.Column('blood_type', sa.String(length=10), nullable=True))
-
-    # owners.emergency_contact (nullable to avoid breaking existing rows)
-    op.add_column('owners', sa.Column('emergency_contact', sa.String(length=20), nullable=True))
-
-    # owners.preferred_payment_method enum (nullable)
-    op.add_column('owners', sa.Column('preferred_payment_method', sa.Enum('cash', 'credit', 'debit', 'insurance', name='payment_method'), nullable=True))
+    # 3) Alter tables: add columns, one multi-action ALTER TABLE per table so
+    # the ACCESS EXCLUSIVE lock is taken once instead of per column. On PG>=11
+    # the NOT NULL DEFAULT false column is a metadata-only add (the default is
+    # a constant), so neither statement scans or rewrites the table.
+    op.execute(
+        "ALTER TABLE pets "
+        "ADD COLUMN microchip_number VARCHAR(50), "
+        "ADD COLUMN is_neutered BOOLEAN NOT NULL DEFAULT false, "
+        "ADD COLUMN blood_type VARCHAR(10), "
+        "ADD CONSTRAINT uq_pets_microchip_number UNIQUE (microchip_number)"
+    )
+    op.execute(
+        "ALTER TABLE owners "
+        "ADD COLUMN emergency_contact VARCHAR(20), "
+        "ADD COLUMN preferred_payment_method payment_method"
+    )
 
     # 4) Initialize existing rows: ensure is_neutered has a defined value
     op.execute("UPDATE pets SET is_neutered = false WHERE is_neutered IS NULL")
-    # Drop any temporary backup tables if present to keep schema clean.
-    # Backups were created at the start of this migration under names
-    # `backup_{revision}_pets` and `backup_{revision}_owners`. If you prefer to
-    # keep them for audit, remove these DROP statements.
-    op.execute(f"DROP TABLE IF EXISTS {backup_pets}")
-    op.execute(f"DROP TABLE IF EXISTS {backup_owners}")
     # ### end Alembic commands ###
 
 
@@ -99,49 +96,61 @@ def downgrade() -> None:
     - Drop enum type `payment_method` if it exists (note: this may fail if other objects depend on it).
     """
 
-    # Create small backups of the new columns to preserve them prior to dropping
-    op.execute(f"""
+    # Create small backups of the new columns to preserve them prior to dropping.
+    # If VET_MIGRATION_DUMP_PATH points at a directory, the columns are
+    # streamed to CSV files there via COPY TO STDOUT - no new table, index or
+    # WAL, roughly half the write amplification of the CTAS path. Without the
+    # flag the in-database CTAS backups are kept so the downgrade stays
+    # self-contained.
+    dump_dir = os.environ.get('VET_MIGRATION_DUMP_PATH')
+    if dump_dir:
+        bind = op.get_bind()
+        _dump_to_file(
+            bind,
+            "SELECT pet_id, microchip_number, is_neutered, blood_type FROM pets",
+            os.path.join(dump_dir, f'{backup_pets_newcols}.csv'),
+        )
+        _dump_to_file(
+            bind,
+            "SELECT owner_id, emergency_contact, preferred_payment_method FROM owners",
+            os.path.join(dump_dir, f'{backup_owners_newcols}.csv'),
+        )
+    else:
+        # Same single pg_catalog scan for both existence checks as in upgrade().
+        op.execute(f"""
     DO $$
+    DECLARE
+        have_pets boolean;
+        have_owners boolean;
     BEGIN
-        IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{backup_pets_newcols}') THEN
+        SELECT bool_or(c.relname = '{backup_pets_newcols}'),
+               bool_or(c.relname = '{backup_owners_newcols}')
+        INTO have_pets, have_owners
+        FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+          AND c.relname IN ('{backup_pets_newcols}', '{backup_owners_newcols}');
+        IF have_pets IS NOT TRUE THEN
             CREATE TABLE {backup_pets_newcols} AS SELECT pet_id, microchip_number, is_neutered, blood_type FROM pets;
         END IF;
-        IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = '{backup_owners_newcols}') THEN
+        IF have_owners IS NOT TRUE THEN
             CREATE TABLE {backup_owners_newcols} AS SELECT owner_id, emergency_contact, preferred_payment_method FROM owners;
         END IF;
     END
     $$;
-    """)
+        """)
+
+    # Drop the unique constraint and the added columns. IF EXISTS keeps the
+    # downgrade best-effort without the failed roundtrips and savepoint
+    # rollbacks that try/except around the Alembic ops produced.
+    op.execute("ALTER TABLE pets DROP CONSTRAINT IF EXISTS uq_pets_microchip_number")
+
+    op.execute("ALTER TABLE pets DROP COLUMN IF EXISTS microchip_number")
+    op.execute("ALTER TABLE pets DROP COLUMN IF EXISTS is_neutered")
+    op.execute("ALTER TABLE pets DROP COLUMN IF EXISTS blood_type")
 
-    # Drop unique constraint on microchip_number if present
-    try:
-        op.drop_constraint('uq_pets_microchip_number', 'pets', type_='unique')
-    except Exception:
-        pass
-
-    # Drop columns from pets
-    try:
-        op.drop_column('pets', 'microchip_number')
-    except Exception:
-        pass
-    try:
-        op.drop_column('pets', 'is_neutered')
-    except Exception:
-        pass
-    try:
-        op.drop_column('pets', 'blood_type')
-    except Exception:
-        pass
-
-    # Drop columns from owners
-    try:
-        op.drop_column('owners', 'emergency_contact')
-    except Exception:
-        pass
-    try:
-        op.drop_column('owners', 'preferred_payment_method')
-    except Exception:
-        pass
+    op.execute("ALTER TABLE owners DROP COLUMN IF EXISTS emergency_contact")
+    op.execute("ALTER TABLE owners DROP COLUMN IF EXISTS preferred_payment_method")
 
     # Attempt to drop enum type (Postgres). This is best-effort and may fail if the type
     # is still in use elsewhere; in that case DB admin intervention is required.
@@ -149,10 +158,14 @@ def downgrade() -> None:
 
 
 # DEV NOTES
-# - Backups: full-table backups of `pets` and `owners` are created at the start of
-#   `upgrade()` under names `backup_{revision}_pets` and `backup_{revision}_owners`.
-#   Additionally, `downgrade()` creates focused backups of the new columns only
-#   (`backup_{revision}_pets_newcols`, `backup_{revision}_owners_newcols`) before removing columns.
+# - Backups: `upgrade()` no longer copies `pets`/`owners` in-database (that made
+#   the migration O(table size) in locks and WAL). Take the backup outside the
+#   transaction with `alembic/pre_upgrade.sh` (pg_dump --format=custom of both
+#   tables), or set VET_PRE_UPGRADE_BACKUP=1 so env.py runs it before migrating.
+#   Restore a table with: pg_restore --data-only -t pets backup_pets_owners.dump
+#   Additionally, `downgrade()` preserves the new columns before removing them:
+#   streamed to CSV under $VET_MIGRATION_DUMP_PATH when that flag is set, else
+#   into `backup_{revision}_pets_newcols` / `backup_{revision}_owners_newcols` tables.
 # - Microchip uniqueness: a UNIQUE constraint `uq_pets_microchip_number` is added.
 #   Note: Postgres allows multiple NULLs for UNIQUE columns. If you require at-most-one NULL,
 #   implement a partial unique index instead.
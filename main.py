@@ -1,365 +1,595 @@
-from fastapi import FastAPI, HTTPException, Depends
-from datetime import date, datetime
-import models
-from typing import List, Annotated, ClassVar, Optional
-from database import SessionLocal, engine
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from sqlalchemy.exc import IntegrityError
-
-
-from schemas import (
-    VeterinarianCreate,
-    VeterinarianRead,
-    OwnerCreate,
-    OwnerRead,
-    PetCreate,
-    PetRead,
-    AppointmentCreate,
-    AppointmentRead,
-    OwnerWithPets,
-    PetWithAppointments,
-)
-
-
-
-app = FastAPI(title="Veterinary Clinic Management API", version="1.0.0")
-models.Base.metadata.create_all(bind=engine)
-
-
-def get_db():
-		db = SessionLocal()
-		try:
-			yield db
-		finally:
-			db.close()
-
-db_dependency = Annotated[Session, Depends(get_db)]
-
-
-# ---------------- Veterinary / Owners / Pets / Appointments Endpoints ----------------
-
-# -- Veterinarians
-@app.get("/veterinarians", response_model=List[VeterinarianRead])
-def list_veterinarians(db: Session = Depends(get_db)):
-    return db.query(models.Veterinarians).all()
-
-
-@app.get("/veterinarians/{vet_id}", response_model=VeterinarianRead)
-def get_veterinarian(vet_id: int, db: Session = Depends(get_db)):
-    v = db.query(models.Veterinarians).get(vet_id)
-    if not v:
-        raise HTTPException(404, "Veterinarian not found")
-    return v
-
-
-@app.get("/veterinarians/{vet_id}/appointments", response_model=List[AppointmentRead])
-def get_vet_appointments(vet_id: int, db: Session = Depends(get_db)):
-    if not db.query(models.Veterinarians).get(vet_id):
-        raise HTTPException(404, "Veterinarian not found")
-    return db.query(models.Appointments).filter(models.Appointments.veterinarian_id == vet_id).all()
-
-
-@app.get("/veterinarians/{vet_id}/schedule", response_model=List[AppointmentRead])
-def get_vet_schedule(vet_id: int, date: Optional[date] = None, db: Session = Depends(get_db)):
-    if not db.query(models.Veterinarians).get(vet_id):
-        raise HTTPException(404, "Veterinarian not found")
-    q = db.query(models.Appointments).filter(models.Appointments.veterinarian_id == vet_id)
-    if date is not None:
-        q = q.filter(func.date(models.Appointments.appointment_date) == date)
-    return q.order_by(models.Appointments.appointment_date).all()
-
-
-@app.post("/veterinarians", response_model=VeterinarianRead)
-def create_veterinarian(payload: VeterinarianCreate, db: Session = Depends(get_db)):
-    # uniqueness checks
-    if db.query(models.Veterinarians).filter(models.Veterinarians.email == payload.email).first():
-        raise HTTPException(status_code=400, detail="Email already registered")
-    if db.query(models.Veterinarians).filter(models.Veterinarians.license_number == payload.license_number).first():
-        raise HTTPException(status_code=400, detail="License number already used")
-    v = models.Veterinarians(**payload.dict(exclude_unset=True))
-    db.add(v)
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=409, detail="Conflict creating veterinarian")
-    db.refresh(v)
-    return v
-
-
-@app.put("/veterinarians/{vet_id}", response_model=VeterinarianRead)
-def replace_veterinarian(vet_id: int, payload: VeterinarianCreate, db: Session = Depends(get_db)):
-    v = db.query(models.Veterinarians).get(vet_id)
-    if not v:
-        raise HTTPException(404, "Veterinarian not found")
-    for k, val in payload.dict(exclude_unset=True).items():
-        setattr(v, k, val)
-    db.commit()
-    return v
-
-
-@app.delete("/veterinarians/{vet_id}")
-def delete_veterinarian(vet_id: int, db: Session = Depends(get_db)):
-    v = db.query(models.Veterinarians).get(vet_id)
-    if not v:
-        raise HTTPException(404, "Veterinarian not found")
-    # do not allow removal if future appointments exist
-    future = db.query(models.Appointments).filter(models.Appointments.veterinarian_id == vet_id, models.Appointments.appointment_date >= datetime.utcnow()).first()
-    if future:
-        raise HTTPException(status_code=400, detail="Veterinarian has upcoming appointments and cannot be deleted")
-    db.delete(v)
-    db.commit()
-    return {"detail": "Veterinarian deleted"}
-
-
-# -- Owners
-@app.get("/owners", response_model=List[OwnerRead])
-def list_owners(db: Session = Depends(get_db)):
-    return db.query(models.Owners).all()
-
-
-@app.get("/owners/{owner_id}", response_model=OwnerRead)
-def get_owner(owner_id: int, db: Session = Depends(get_db)):
-    o = db.query(models.Owners).get(owner_id)
-    if not o:
-        raise HTTPException(404, "Owner not found")
-    return o
-
-
-@app.get("/owners/{owner_id}/pets", response_model=List[PetRead])
-def get_owner_pets(owner_id: int, db: Session = Depends(get_db)):
-    if not db.query(models.Owners).get(owner_id):
-        raise HTTPException(404, "Owner not found")
-    return db.query(models.Pets).filter(models.Pets.owner_id == owner_id).all()
-
-
-@app.get("/owners/{owner_id}/appointments", response_model=List[AppointmentRead])
-def get_owner_appointments(owner_id: int, db: Session = Depends(get_db)):
-    if not db.query(models.Owners).get(owner_id):
-        raise HTTPException(404, "Owner not found")
-    return db.query(models.Appointments).join(models.Pets).filter(models.Pets.owner_id == owner_id).all()
-
-
-@app.post("/owners", response_model=OwnerRead)
-def create_owner(payload: OwnerCreate, db: Session = Depends(get_db)):
-    if db.query(models.Owners).filter(models.Owners.email == payload.email).first():
-        raise HTTPException(status_code=400, detail="Email already registered")
-    o = models.Owners(**payload.dict(exclude_unset=True))
-    db.add(o)
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=409, detail="Conflict creating owner")
-    db.refresh(o)
-    return o
-
-
-@app.put("/owners/{owner_id}", response_model=OwnerRead)
-def replace_owner(owner_id: int, payload: OwnerCreate, db: Session = Depends(get_db)):
-    o = db.query(models.Owners).get(owner_id)
-    if not o:
-        raise HTTPException(404, "Owner not found")
-    for k, val in payload.dict(exclude_unset=True).items():
-        setattr(o, k, val)
-    db.commit()
-    return o
-
-
-@app.delete("/owners/{owner_id}")
-def delete_owner(owner_id: int, db: Session = Depends(get_db)):
-    o = db.query(models.Owners).get(owner_id)
-    if not o:
-        raise HTTPException(404, "Owner not found")
-    # prevent deleting if owner has pets
-    has_pets = db.query(models.Pets).filter(models.Pets.owner_id == owner_id).first()
-    if has_pets:
-        raise HTTPException(status_code=400, detail="Owner has pets and cannot be deleted")
-    db.delete(o)
-    db.commit()
-    return {"detail": "Owner deleted"}
-
-
-# -- Pets
-@app.get("/pets", response_model=List[PetRead])
-def list_pets(db: Session = Depends(get_db)):
-    return db.query(models.Pets).all()
-
-
-@app.get("/pets/{pet_id}", response_model=PetRead)
-def get_pet(pet_id: int, db: Session = Depends(get_db)):
-    p = db.query(models.Pets).get(pet_id)
-    if not p:
-        raise HTTPException(404, "Pet not found")
-    return p
-
-
-@app.get("/pets/{pet_id}/medical-history")
-def get_pet_medical_history(pet_id: int, db: Session = Depends(get_db)):
-    # Placeholder: requires medical records migration
-    raise HTTPException(status_code=501, detail="Medical records require migration")
-
-
-@app.get("/pets/{pet_id}/vaccinations")
-def get_pet_vaccinations(pet_id: int, db: Session = Depends(get_db)):
-    # Placeholder: requires vaccinations migration
-    raise HTTPException(status_code=501, detail="Vaccination records require migration")
-
-
-@app.post("/pets", response_model=PetRead)
-def create_pet(payload: PetCreate, db: Session = Depends(get_db)):
-    # validate owner exists
-    if not db.query(models.Owners).get(payload.owner_id):
-        raise HTTPException(status_code=400, detail="Owner not found")
-    p = models.Pets(**payload.dict(exclude_unset=True))
-    db.add(p)
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=409, detail="Conflict creating pet")
-    db.refresh(p)
-    return p
-
-
-@app.put("/pets/{pet_id}", response_model=PetRead)
-def replace_pet(pet_id: int, payload: PetCreate, db: Session = Depends(get_db)):
-    p = db.query(models.Pets).get(pet_id)
-    if not p:
-        raise HTTPException(404, "Pet not found")
-    for k, val in payload.dict(exclude_unset=True).items():
-        setattr(p, k, val)
-    db.commit()
-    return p
-
-
-@app.delete("/pets/{pet_id}")
-def delete_pet(pet_id: int, db: Session = Depends(get_db)):
-    p = db.query(models.Pets).get(pet_id)
-    if not p:
-        raise HTTPException(404, "Pet not found")
-    # prevent deleting if future appointments
-    future = db.query(models.Appointments).filter(models.Appointments.pet_id == pet_id, models.Appointments.appointment_date >= datetime.utcnow()).first()
-    if future:
-        raise HTTPException(status_code=400, detail="Pet has upcoming appointments and cannot be deleted")
-    db.delete(p)
-    db.commit()
-    return {"detail": "Pet deleted"}
-
-
-# -- Appointments
-@app.get("/appointments", response_model=List[AppointmentRead])
-def list_appointments(db: Session = Depends(get_db)):
-    return db.query(models.Appointments).all()
-
-
-@app.get("/appointments/{appointment_id}", response_model=AppointmentRead)
-def get_appointment(appointment_id: int, db: Session = Depends(get_db)):
-    a = db.query(models.Appointments).get(appointment_id)
-    if not a:
-        raise HTTPException(404, "Appointment not found")
-    return a
-
-
-@app.get("/appointments/today", response_model=List[AppointmentRead])
-def get_appointments_today(db: Session = Depends(get_db)):
-    today = datetime.utcnow().date()
-    return db.query(models.Appointments).filter(func.date(models.Appointments.appointment_date) == today).all()
-
-
-@app.get("/appointments/pending", response_model=List[AppointmentRead])
-def get_pending_appointments(db: Session = Depends(get_db)):
-    return db.query(models.Appointments).filter(models.Appointments.status == 'scheduled').all()
-
-
-@app.post("/appointments", response_model=AppointmentRead)
-def create_appointment(payload: AppointmentCreate, db: Session = Depends(get_db)):
-    # validate pet and vet
-    pet = db.query(models.Pets).get(payload.pet_id)
-    if not pet:
-        raise HTTPException(status_code=400, detail="Pet not found")
-    vet = db.query(models.Veterinarians).get(payload.veterinarian_id)
-    if not vet:
-        raise HTTPException(status_code=400, detail="Veterinarian not found")
-    # appointment_date should be present and not in the past
-    if payload.appointment_date < datetime.utcnow():
-        raise HTTPException(status_code=400, detail="Appointment date must be in the future")
-    new = models.Appointments(**payload.dict(exclude_unset=True))
-    db.add(new)
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        raise HTTPException(status_code=409, detail="Conflict creating appointment")
-    db.refresh(new)
-    return new
-
-
-@app.put("/appointments/{appointment_id}", response_model=AppointmentRead)
-def replace_appointment(appointment_id: int, payload: AppointmentCreate, db: Session = Depends(get_db)):
-    a = db.query(models.Appointments).get(appointment_id)
-    if not a:
-        raise HTTPException(404, "Appointment not found")
-    for k, val in payload.dict(exclude_unset=True).items():
-        setattr(a, k, val)
-    db.commit()
-    return a
-
-
-@app.put("/appointments/{appointment_id}/complete", response_model=AppointmentRead)
-def complete_appointment(appointment_id: int, db: Session = Depends(get_db)):
-    a = db.query(models.Appointments).get(appointment_id)
-    if not a:
-        raise HTTPException(404, "Appointment not found")
-    if a.status == 'completed':
-        raise HTTPException(status_code=400, detail="Appointment already completed")
-    a.status = 'completed'
-    db.commit()
-    return a
-
-
-@app.put("/appointments/{appointment_id}/cancel", response_model=AppointmentRead)
-def cancel_appointment(appointment_id: int, db: Session = Depends(get_db)):
-    a = db.query(models.Appointments).get(appointment_id)
-    if not a:
-        raise HTTPException(404, "Appointment not found")
-    if a.status in ['cancelled', 'completed']:
-        raise HTTPException(status_code=400, detail="Appointment cannot be cancelled")
-    a.status = 'cancelled'
-    db.commit()
-    return a
-
-
-@app.delete("/appointments/{appointment_id}")
-def delete_appointment(appointment_id: int, db: Session = Depends(get_db)):
-    a = db.query(models.Appointments).get(appointment_id)
-    if not a:
-        raise HTTPException(404, "Appointment not found")
-    db.delete(a)
-    db.commit()
-    return {"detail": "Appointment deleted"}
-
-
-# -- Medical Records / Vaccines / Invoices / Reports placeholders
-@app.get("/medical-records")
-def list_medical_records():
-    raise HTTPException(status_code=501, detail="Medical records require migration 1")
-
-
-@app.get("/vaccines")
-def list_vaccines():
-    raise HTTPException(status_code=501, detail="Vaccines require migration 2")
-
-
-@app.get("/invoices")
-def list_invoices():
-    raise HTTPException(status_code=501, detail="Invoices require migration 4")
-
-
-@app.get("/reports/revenue")
-def report_revenue(start_date: Optional[date] = None, end_date: Optional[date] = None):
-    raise HTTPException(status_code=501, detail="Reports require all migrations")
-
-
-
+import os
+
+import orjson
+from fastapi import FastAPI, HTTPException, Depends
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from datetime import date, datetime, timedelta, timezone
+import models
+from typing import List, Annotated, ClassVar, Optional
+from database import AsyncSessionLocal, engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import bindparam, func, lambda_stmt, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+
+
+from schemas import (
+    VeterinarianCreate,
+    VeterinarianRead,
+    OwnerCreate,
+    OwnerRead,
+    PetCreate,
+    PetRead,
+    AppointmentCreate,
+    AppointmentRead,
+    OwnerWithPets,
+    PetWithAppointments,
+)
+
+
+
+app = FastAPI(
+    title="Veterinary Clinic Management API",
+    version="1.0.0",
+    # orjson serializes responses in native code (datetimes included); the
+    # stdlib json encoder dominated CPU on large list payloads
+    default_response_class=ORJSONResponse,
+)
+
+# Alembic owns the schema; create_all is a dev/bootstrap convenience only.
+# Unconditional, it reflected pg_catalog for every table on each worker boot.
+if os.environ.get("VET_CREATE_ALL") == "1":
+    # the enum types carry create_type=False (Alembic owns them), so the dev
+    # bootstrap has to create them explicitly before the tables
+    models.Pets.__table__.c.species.type.create(engine, checkfirst=True)
+    models.Appointments.__table__.c.status.type.create(engine, checkfirst=True)
+    models.Base.metadata.create_all(bind=engine)
+
+
+async def get_db():
+    # AsyncSession over asyncpg: handlers await the DB instead of parking a
+    # threadpool thread per in-flight request
+    async with AsyncSessionLocal() as db:
+        yield db
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+
+
+def _as_utc(dt: datetime) -> datetime:
+    """Treat naive client datetimes as UTC so they compare against aware now()."""
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def _as_naive_utc(dt: datetime) -> datetime:
+    """Normalize a client datetime for the naive TIMESTAMP columns.
+
+    Aware values are converted to UTC and stripped of tzinfo; naive values
+    pass through. asyncpg (unlike psycopg2) refuses aware datetimes on naive
+    columns, so this must run on anything that gets persisted.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _integrity_cause(e: IntegrityError) -> str:
+    """Classify an IntegrityError as 'fk', 'unique' or 'other'.
+
+    Reads the SQLSTATE (psycopg2 exposes pgcode, the asyncpg adapter
+    sqlstate, sometimes only on the wrapped exception's __cause__) and falls
+    back to sniffing the message, so handlers can answer 400 for a missing
+    foreign key but 409 for a duplicate.
+    """
+    for exc in (e.orig, getattr(e.orig, '__cause__', None)):
+        code = getattr(exc, 'pgcode', None) or getattr(exc, 'sqlstate', None)
+        if code == '23503':
+            return 'fk'
+        if code == '23505':
+            return 'unique'
+    msg = str(e.orig).lower()
+    if 'foreign key' in msg:
+        return 'fk'
+    if 'unique' in msg or 'duplicate' in msg:
+        return 'unique'
+    return 'other'
+
+
+async def _stream_rows(db: AsyncSession, model, limit: Optional[int] = None, offset: Optional[int] = None) -> StreamingResponse:
+    """Stream a whole table as a JSON array without materializing it.
+
+    Rows are fetched in 500-row server-side batches (yield_per) and serialized
+    straight from column mappings with orjson, so memory stays bounded no
+    matter how large the table is. limit/offset let clients page instead of
+    streaming everything.
+    """
+    stmt = select(model.__table__)
+    if offset is not None:
+        stmt = stmt.offset(offset)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    result = await db.stream(stmt.execution_options(yield_per=500))
+    mappings = result.mappings()
+
+    async def gen():
+        yield b"["
+        first = True
+        async for row in mappings:
+            if not first:
+                yield b","
+            first = False
+            yield orjson.dumps(dict(row), default=str)
+        yield b"]"
+
+    return StreamingResponse(gen(), media_type="application/json")
+
+
+# Per-id lookup statements, built once at module scope: lambda_stmt caches the
+# compiled SQL and bind structure, so the hot GET-by-id handlers skip ORM
+# statement construction entirely.
+_vet_by_id = lambda_stmt(lambda: select(models.Veterinarians).where(
+    models.Veterinarians.veterinarian_id == bindparam('id')))
+_owner_by_id = lambda_stmt(lambda: select(models.Owners)
+    .options(selectinload(models.Owners.pets))
+    .where(models.Owners.owner_id == bindparam('id')))
+_pet_by_id = lambda_stmt(lambda: select(models.Pets)
+    .options(selectinload(models.Pets.appointments))
+    .where(models.Pets.pet_id == bindparam('id')))
+_appointment_by_id = lambda_stmt(lambda: select(models.Appointments).where(
+    models.Appointments.appointment_id == bindparam('id')))
+
+
+# ---------------- Veterinary / Owners / Pets / Appointments Endpoints ----------------
+
+# -- Veterinarians
+@app.get("/veterinarians", response_model=List[VeterinarianRead])
+async def list_veterinarians(limit: Optional[int] = None, offset: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    return await _stream_rows(db, models.Veterinarians, limit, offset)
+
+
+@app.get("/veterinarians/{vet_id}", response_model=VeterinarianRead)
+async def get_veterinarian(vet_id: int, db: AsyncSession = Depends(get_db)):
+    v = (await db.execute(_vet_by_id, {'id': vet_id})).scalar_one_or_none()
+    if not v:
+        raise HTTPException(404, "Veterinarian not found")
+    return v
+
+
+@app.get("/veterinarians/{vet_id}/appointments", response_model=List[AppointmentRead])
+async def get_vet_appointments(vet_id: int, db: AsyncSession = Depends(get_db)):
+    # single query; the existence probe only runs on the empty-result path
+    appts = (await db.execute(
+        select(models.Appointments).where(models.Appointments.veterinarian_id == vet_id)
+    )).scalars().all()
+    if not appts and not await db.get(models.Veterinarians, vet_id):
+        raise HTTPException(404, "Veterinarian not found")
+    return appts
+
+
+@app.get("/veterinarians/{vet_id}/schedule", response_model=List[AppointmentRead])
+async def get_vet_schedule(vet_id: int, date: Optional[date] = None, db: AsyncSession = Depends(get_db)):
+    stmt = select(models.Appointments).where(models.Appointments.veterinarian_id == vet_id)
+    if date is not None:
+        # half-open range instead of func.date(...): keeps the column bare so
+        # the btree index on appointment_date is usable
+        stmt = stmt.where(
+            models.Appointments.appointment_date >= date,
+            models.Appointments.appointment_date < date + timedelta(days=1),
+        )
+    appts = (await db.execute(stmt.order_by(models.Appointments.appointment_date))).scalars().all()
+    if not appts and not await db.get(models.Veterinarians, vet_id):
+        raise HTTPException(404, "Veterinarian not found")
+    return appts
+
+
+@app.post("/veterinarians", response_model=VeterinarianRead)
+async def create_veterinarian(payload: VeterinarianCreate, db: AsyncSession = Depends(get_db)):
+    # single INSERT; uniqueness is resolved by ON CONFLICT DO NOTHING instead
+    # of SELECT probes, which also closes the check-then-insert race
+    stmt = (
+        pg_insert(models.Veterinarians)
+        .values(**payload.model_dump(exclude_unset=True))
+        .on_conflict_do_nothing()
+        .returning(*models.Veterinarians.__table__.c)
+    )
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        # one probe, only on the conflict path, to name the offending field
+        dup = (await db.execute(
+            select(models.Veterinarians.veterinarian_id).where(models.Veterinarians.email == payload.email)
+        )).first()
+        if dup:
+            raise HTTPException(status_code=400, detail="Email already registered")
+        raise HTTPException(status_code=400, detail="License number already used")
+    await db.commit()
+    return row
+
+
+@app.put("/veterinarians/{vet_id}", response_model=VeterinarianRead)
+async def replace_veterinarian(vet_id: int, payload: VeterinarianCreate, db: AsyncSession = Depends(get_db)):
+    v = await db.get(models.Veterinarians, vet_id)
+    if not v:
+        raise HTTPException(404, "Veterinarian not found")
+    for k, val in payload.model_dump(exclude_unset=True).items():
+        setattr(v, k, val)
+    await db.commit()
+    return v
+
+
+@app.delete("/veterinarians/{vet_id}")
+async def delete_veterinarian(vet_id: int, db: AsyncSession = Depends(get_db)):
+    # guard (no future appointments), cascade of past appointments and the
+    # delete itself compressed into one statement / one round-trip; the two
+    # extra queries only run on the failure path to pick 404 vs 400
+    row = (await db.execute(
+        text("""
+            WITH doomed AS (
+                DELETE FROM appointments a
+                WHERE a.veterinarian_id = :id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM appointments f
+                      WHERE f.veterinarian_id = :id AND f.appointment_date >= now()
+                  )
+            )
+            DELETE FROM veterinarians v
+            WHERE v.veterinarian_id = :id
+              AND NOT EXISTS (
+                  SELECT 1 FROM appointments f
+                  WHERE f.veterinarian_id = :id AND f.appointment_date >= now()
+              )
+            RETURNING v.veterinarian_id
+        """),
+        {"id": vet_id},
+    )).fetchone()
+    if row is None:
+        if not await db.get(models.Veterinarians, vet_id):
+            raise HTTPException(404, "Veterinarian not found")
+        raise HTTPException(status_code=400, detail="Veterinarian has upcoming appointments and cannot be deleted")
+    await db.commit()
+    return {"detail": "Veterinarian deleted"}
+
+
+# -- Owners
+@app.get("/owners", response_model=List[OwnerRead])
+async def list_owners(limit: Optional[int] = None, offset: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    return await _stream_rows(db, models.Owners, limit, offset)
+
+
+@app.get("/owners/full", response_model=List[OwnerWithPets])
+async def list_owners_with_pets(db: AsyncSession = Depends(get_db)):
+    # selectinload fetches every owner's pets in one IN (...) batch instead of
+    # one lazy SELECT per owner row (N+1)
+    return (await db.execute(
+        select(models.Owners).options(selectinload(models.Owners.pets))
+    )).scalars().all()
+
+
+@app.get("/owners/{owner_id}", response_model=OwnerWithPets)
+async def get_owner(owner_id: int, db: AsyncSession = Depends(get_db)):
+    o = (await db.execute(_owner_by_id, {'id': owner_id})).scalar_one_or_none()
+    if not o:
+        raise HTTPException(404, "Owner not found")
+    return o
+
+
+@app.get("/owners/{owner_id}/pets", response_model=List[PetRead])
+async def get_owner_pets(owner_id: int, db: AsyncSession = Depends(get_db)):
+    pets = (await db.execute(
+        select(models.Pets).where(models.Pets.owner_id == owner_id)
+    )).scalars().all()
+    if not pets and not await db.get(models.Owners, owner_id):
+        raise HTTPException(404, "Owner not found")
+    return pets
+
+
+@app.get("/owners/{owner_id}/appointments", response_model=List[AppointmentRead])
+async def get_owner_appointments(owner_id: int, db: AsyncSession = Depends(get_db)):
+    appts = (await db.execute(
+        select(models.Appointments).join(models.Pets).where(models.Pets.owner_id == owner_id)
+    )).scalars().all()
+    if not appts and not await db.get(models.Owners, owner_id):
+        raise HTTPException(404, "Owner not found")
+    return appts
+
+
+@app.post("/owners", response_model=OwnerRead)
+async def create_owner(payload: OwnerCreate, db: AsyncSession = Depends(get_db)):
+    # single INSERT; see create_veterinarian for the ON CONFLICT rationale
+    stmt = (
+        pg_insert(models.Owners)
+        .values(**payload.model_dump(exclude_unset=True))
+        .on_conflict_do_nothing(index_elements=['email'])
+        .returning(*models.Owners.__table__.c)
+    )
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await db.commit()
+    return row
+
+
+@app.put("/owners/{owner_id}", response_model=OwnerRead)
+async def replace_owner(owner_id: int, payload: OwnerCreate, db: AsyncSession = Depends(get_db)):
+    o = await db.get(models.Owners, owner_id)
+    if not o:
+        raise HTTPException(404, "Owner not found")
+    for k, val in payload.model_dump(exclude_unset=True).items():
+        setattr(o, k, val)
+    await db.commit()
+    return o
+
+
+@app.delete("/owners/{owner_id}")
+async def delete_owner(owner_id: int, db: AsyncSession = Depends(get_db)):
+    # existence check, pet guard and delete in one statement; see
+    # delete_veterinarian for the round-trip rationale
+    row = (await db.execute(
+        text(
+            "DELETE FROM owners o WHERE o.owner_id = :id "
+            "AND NOT EXISTS (SELECT 1 FROM pets p WHERE p.owner_id = :id) "
+            "RETURNING o.owner_id"
+        ),
+        {"id": owner_id},
+    )).fetchone()
+    if row is None:
+        if not await db.get(models.Owners, owner_id):
+            raise HTTPException(404, "Owner not found")
+        raise HTTPException(status_code=400, detail="Owner has pets and cannot be deleted")
+    await db.commit()
+    return {"detail": "Owner deleted"}
+
+
+# -- Pets
+@app.get("/pets", response_model=List[PetRead])
+async def list_pets(limit: Optional[int] = None, offset: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    return await _stream_rows(db, models.Pets, limit, offset)
+
+
+@app.get("/pets/{pet_id}", response_model=PetWithAppointments)
+async def get_pet(pet_id: int, db: AsyncSession = Depends(get_db)):
+    p = (await db.execute(_pet_by_id, {'id': pet_id})).scalar_one_or_none()
+    if not p:
+        raise HTTPException(404, "Pet not found")
+    return p
+
+
+@app.get("/pets/{pet_id}/medical-history")
+async def get_pet_medical_history(pet_id: int, db: AsyncSession = Depends(get_db)):
+    # Placeholder: requires medical records migration
+    raise HTTPException(status_code=501, detail="Medical records require migration")
+
+
+@app.get("/pets/{pet_id}/vaccinations")
+async def get_pet_vaccinations(pet_id: int, db: AsyncSession = Depends(get_db)):
+    # Placeholder: requires vaccinations migration
+    raise HTTPException(status_code=501, detail="Vaccination records require migration")
+
+
+@app.post("/pets", response_model=PetRead)
+async def create_pet(payload: PetCreate, db: AsyncSession = Depends(get_db)):
+    # owner validation is left to the FK constraint: one INSERT instead of a
+    # SELECT probe plus INSERT
+    p = models.Pets(**payload.model_dump(exclude_unset=True))
+    db.add(p)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if _integrity_cause(e) == 'unique':
+            raise HTTPException(status_code=409, detail="An identical pet is already registered for this owner")
+        raise HTTPException(status_code=400, detail="Owner not found")
+    await db.refresh(p)
+    return p
+
+
+@app.put("/pets/{pet_id}", response_model=PetRead)
+async def replace_pet(pet_id: int, payload: PetCreate, db: AsyncSession = Depends(get_db)):
+    p = await db.get(models.Pets, pet_id)
+    if not p:
+        raise HTTPException(404, "Pet not found")
+    for k, val in payload.model_dump(exclude_unset=True).items():
+        setattr(p, k, val)
+    await db.commit()
+    return p
+
+
+@app.delete("/pets/{pet_id}")
+async def delete_pet(pet_id: int, db: AsyncSession = Depends(get_db)):
+    # same single-statement shape as delete_veterinarian: past appointments
+    # are cascaded in the CTE, the guard blocks on any future appointment
+    row = (await db.execute(
+        text("""
+            WITH doomed AS (
+                DELETE FROM appointments a
+                WHERE a.pet_id = :id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM appointments f
+                      WHERE f.pet_id = :id AND f.appointment_date >= now()
+                  )
+            )
+            DELETE FROM pets p
+            WHERE p.pet_id = :id
+              AND NOT EXISTS (
+                  SELECT 1 FROM appointments f
+                  WHERE f.pet_id = :id AND f.appointment_date >= now()
+              )
+            RETURNING p.pet_id
+        """),
+        {"id": pet_id},
+    )).fetchone()
+    if row is None:
+        if not await db.get(models.Pets, pet_id):
+            raise HTTPException(404, "Pet not found")
+        raise HTTPException(status_code=400, detail="Pet has upcoming appointments and cannot be deleted")
+    await db.commit()
+    return {"detail": "Pet deleted"}
+
+
+# -- Appointments
+@app.get("/appointments", response_model=List[AppointmentRead])
+async def list_appointments(limit: Optional[int] = None, offset: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    return await _stream_rows(db, models.Appointments, limit, offset)
+
+
+# static paths registered before the parameterized one: FastAPI matches
+# routes in declaration order, so /appointments/{appointment_id} would
+# otherwise swallow "today" and "pending" and 422 on them
+@app.get("/appointments/today", response_model=List[AppointmentRead])
+async def get_appointments_today(db: AsyncSession = Depends(get_db)):
+    # same half-open range as get_vet_schedule; current_date is evaluated
+    # server-side, so the DB clock defines "today" rather than the app host's
+    return (await db.execute(
+        select(models.Appointments).where(
+            models.Appointments.appointment_date >= func.current_date(),
+            models.Appointments.appointment_date < func.current_date() + timedelta(days=1),
+        )
+    )).scalars().all()
+
+
+@app.get("/appointments/pending", response_model=List[AppointmentRead])
+async def get_pending_appointments(db: AsyncSession = Depends(get_db)):
+    # ordered by date so the plan walks ix_appointments_pending (partial index
+    # on status='scheduled') and returns rows pre-sorted
+    return (await db.execute(
+        select(models.Appointments)
+        .where(models.Appointments.status == 'scheduled')
+        .order_by(models.Appointments.appointment_date)
+    )).scalars().all()
+
+
+@app.get("/appointments/{appointment_id}", response_model=AppointmentRead)
+async def get_appointment(appointment_id: int, db: AsyncSession = Depends(get_db)):
+    a = (await db.execute(_appointment_by_id, {'id': appointment_id})).scalar_one_or_none()
+    if not a:
+        raise HTTPException(404, "Appointment not found")
+    return a
+
+
+@app.post("/appointments", response_model=AppointmentRead)
+async def create_appointment(payload: AppointmentCreate, db: AsyncSession = Depends(get_db)):
+    # appointment_date should be present and not in the past
+    if _as_utc(payload.appointment_date) < datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="Appointment date must be in the future")
+    payload.appointment_date = _as_naive_utc(payload.appointment_date)
+    # pet/vet validation is left to the FK constraints: one INSERT instead of
+    # two SELECT probes plus INSERT
+    new = models.Appointments(**payload.model_dump(exclude_unset=True))
+    db.add(new)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if _integrity_cause(e) == 'unique':
+            raise HTTPException(status_code=409, detail="An appointment for this pet, veterinarian and time already exists")
+        raise HTTPException(status_code=400, detail="Pet or veterinarian not found")
+    await db.refresh(new)
+    return new
+
+
+@app.post("/appointments/bulk", response_model=List[AppointmentRead])
+async def create_appointments_bulk(payloads: List[AppointmentCreate], db: AsyncSession = Depends(get_db)):
+    # import-style endpoint: one multi-row INSERT instead of N single-row
+    # requests, with one batched existence SELECT per foreign key
+    if not payloads:
+        return []
+    now = datetime.now(timezone.utc)
+    if any(_as_utc(p.appointment_date) < now for p in payloads):
+        raise HTTPException(status_code=400, detail="Appointment dates must be in the future")
+    for p in payloads:
+        p.appointment_date = _as_naive_utc(p.appointment_date)
+    pet_ids = {p.pet_id for p in payloads}
+    vet_ids = {p.veterinarian_id for p in payloads}
+    found_pets = {r[0] for r in await db.execute(
+        select(models.Pets.pet_id).where(models.Pets.pet_id.in_(pet_ids)))}
+    if pet_ids - found_pets:
+        raise HTTPException(status_code=400, detail=f"Unknown pet ids: {sorted(pet_ids - found_pets)}")
+    found_vets = {r[0] for r in await db.execute(
+        select(models.Veterinarians.veterinarian_id).where(models.Veterinarians.veterinarian_id.in_(vet_ids)))}
+    if vet_ids - found_vets:
+        raise HTTPException(status_code=400, detail=f"Unknown veterinarian ids: {sorted(vet_ids - found_vets)}")
+    stmt = (
+        pg_insert(models.Appointments)
+        .values([p.model_dump() for p in payloads])
+        .returning(*models.Appointments.__table__.c)
+    )
+    try:
+        rows = (await db.execute(stmt)).fetchall()
+        await db.commit()
+    except IntegrityError as e:
+        # duplicates within the batch or against existing rows trip
+        # uq_appt_pet_vet_date; FKs can still fail on ids deleted between
+        # the existence probe above and the INSERT
+        await db.rollback()
+        if _integrity_cause(e) == 'unique':
+            raise HTTPException(status_code=409, detail="Batch contains duplicate appointments (same pet, veterinarian and time)")
+        raise HTTPException(status_code=400, detail="Batch references an unknown pet or veterinarian")
+    return rows
+
+
+@app.put("/appointments/{appointment_id}", response_model=AppointmentRead)
+async def replace_appointment(appointment_id: int, payload: AppointmentCreate, db: AsyncSession = Depends(get_db)):
+    a = await db.get(models.Appointments, appointment_id)
+    if not a:
+        raise HTTPException(404, "Appointment not found")
+    data = payload.model_dump(exclude_unset=True)
+    if 'appointment_date' in data:
+        data['appointment_date'] = _as_naive_utc(data['appointment_date'])
+    for k, val in data.items():
+        setattr(a, k, val)
+    await db.commit()
+    return a
+
+
+@app.put("/appointments/{appointment_id}/complete", response_model=AppointmentRead)
+async def complete_appointment(appointment_id: int, db: AsyncSession = Depends(get_db)):
+    a = await db.get(models.Appointments, appointment_id)
+    if not a:
+        raise HTTPException(404, "Appointment not found")
+    if a.status == 'completed':
+        raise HTTPException(status_code=400, detail="Appointment already completed")
+    a.status = 'completed'
+    await db.commit()
+    return a
+
+
+@app.put("/appointments/{appointment_id}/cancel", response_model=AppointmentRead)
+async def cancel_appointment(appointment_id: int, db: AsyncSession = Depends(get_db)):
+    a = await db.get(models.Appointments, appointment_id)
+    if not a:
+        raise HTTPException(404, "Appointment not found")
+    if a.status in ['cancelled', 'completed']:
+        raise HTTPException(status_code=400, detail="Appointment cannot be cancelled")
+    a.status = 'cancelled'
+    await db.commit()
+    return a
+
+
+@app.delete("/appointments/{appointment_id}")
+async def delete_appointment(appointment_id: int, db: AsyncSession = Depends(get_db)):
+    a = await db.get(models.Appointments, appointment_id)
+    if not a:
+        raise HTTPException(404, "Appointment not found")
+    await db.delete(a)
+    await db.commit()
+    return {"detail": "Appointment deleted"}
+
+
+# -- Medical Records / Vaccines / Invoices / Reports placeholders
+@app.get("/medical-records")
+def list_medical_records():
+    raise HTTPException(status_code=501, detail="Medical records require migration 1")
+
+
+@app.get("/vaccines")
+def list_vaccines():
+    raise HTTPException(status_code=501, detail="Vaccines require migration 2")
+
+
+@app.get("/invoices")
+def list_invoices():
+    raise HTTPException(status_code=501, detail="Invoices require migration 4")
+
+
+@app.get("/reports/revenue")
+def report_revenue(start_date: Optional[date] = None, end_date: Optional[date] = None):
+    raise HTTPException(status_code=501, detail="Reports require all migrations")
@@ -1,4 +1,5 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Numeric, Text, DateTime, Date, Index, Enum
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Numeric, Text, DateTime, Date, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ENUM
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -36,10 +37,18 @@ class Owners(Base):
 
 class Pets(Base):
     __tablename__ = "pets"
+    # The seed scripts treat (owner_id, name, birth_date) as the identity of
+    # a seeded pet; enforcing it lets their INSERTs target ON CONFLICT and
+    # turns the duplicate probes into index lookups.
+    __table_args__ = (
+        UniqueConstraint('owner_id', 'name', 'birth_date', name='uq_pet_owner_name_bd'),
+    )
 
     pet_id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
-    species = Column(Enum('dog', 'cat', 'bird', 'rabbit', 'other', name='pet_species'), nullable=False)
+    # create_type=False: Alembic owns the enum types, so metadata operations
+    # never probe pg_type or try to (re)create them
+    species = Column(ENUM('dog', 'cat', 'bird', 'rabbit', 'other', name='pet_species', create_type=False), nullable=False)
     breed = Column(String(100), nullable=True)
     birth_date = Column(Date, nullable=True)
     weight = Column(Numeric(6, 2), nullable=False)
@@ -52,13 +61,18 @@ class Pets(Base):
 
 class Appointments(Base):
     __tablename__ = "appointments"
+    # A pet can't see the same vet twice at the same instant; same role as
+    # uq_pet_owner_name_bd for the seed scripts' ON CONFLICT path.
+    __table_args__ = (
+        UniqueConstraint('pet_id', 'veterinarian_id', 'appointment_date', name='uq_appt_pet_vet_date'),
+    )
 
     appointment_id = Column(Integer, primary_key=True, index=True)
     pet_id = Column(Integer, ForeignKey("pets.pet_id"), nullable=False, index=True)
     veterinarian_id = Column(Integer, ForeignKey("veterinarians.veterinarian_id"), nullable=False, index=True)
     appointment_date = Column(DateTime, nullable=False)
     reason = Column(Text, nullable=False)
-    status = Column(Enum('scheduled', 'completed', 'cancelled', 'no_show', name='appointment_status'), nullable=False, default='scheduled', index=True)
+    status = Column(ENUM('scheduled', 'completed', 'cancelled', 'no_show', name='appointment_status', create_type=False), nullable=False, default='scheduled', index=True)
     notes = Column(Text, nullable=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     # relationships
@@ -69,4 +83,10 @@ class Appointments(Base):
 # Indexes for new tables
 Index('ix_pets_owner', Pets.owner_id)
 Index('ix_appointments_vet_status', Appointments.veterinarian_id, Appointments.status)
+Index('ix_appointments_date', Appointments.appointment_date)
+Index('ix_appointments_vet_date', Appointments.veterinarian_id, Appointments.appointment_date)
+# Partial index over the small 'scheduled' slice; serves the pending-appointments
+# endpoint pre-sorted by date while costing writes almost nothing.
+Index('ix_appointments_pending', Appointments.appointment_date,
+      postgresql_where=Appointments.status == 'scheduled')
     
@@ -0,0 +1,106 @@
+"""Pydantic schemas for the Veterinary Clinic Management API.
+
+Create schemas validate request payloads; Read schemas serialize ORM rows
+(`from_attributes=True`). `OwnerWithPets` / `PetWithAppointments` extend the
+plain Read schemas with their child collections — endpoints returning them
+must eager-load the relationship (selectinload) to avoid N+1 lazy loads.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, EmailStr
+
+
+Species = Literal['dog', 'cat', 'bird', 'rabbit', 'other']
+AppointmentStatus = Literal['scheduled', 'completed', 'cancelled', 'no_show']
+
+# extra='forbid' lets pydantic-core skip the extra-field path (and rejects
+# typo'd payload keys); populate_by_name keeps field-name population cheap.
+_strict_config = ConfigDict(extra='forbid', populate_by_name=True)
+_orm_config = ConfigDict(from_attributes=True, extra='forbid', populate_by_name=True)
+
+
+# -- Veterinarians
+class VeterinarianCreate(BaseModel):
+    model_config = _strict_config
+
+    license_number: str
+    first_name: str
+    last_name: str
+    email: EmailStr
+    phone: Optional[str] = None
+    specialization: Optional[str] = None
+    hire_date: Optional[date] = None
+    is_active: bool = True
+
+
+class VeterinarianRead(VeterinarianCreate):
+    model_config = _orm_config
+
+    veterinarian_id: int
+
+
+# -- Owners
+class OwnerCreate(BaseModel):
+    model_config = _strict_config
+
+    first_name: str
+    last_name: str
+    email: EmailStr
+    phone: Optional[str] = None
+    address: Optional[str] = None
+
+
+class OwnerRead(OwnerCreate):
+    model_config = _orm_config
+
+    owner_id: int
+    registration_date: datetime
+
+
+# -- Pets
+class PetCreate(BaseModel):
+    model_config = _strict_config
+
+    name: str
+    species: Species
+    breed: Optional[str] = None
+    birth_date: Optional[date] = None
+    weight: Decimal
+    owner_id: int
+
+
+class PetRead(PetCreate):
+    model_config = _orm_config
+
+    pet_id: int
+    registration_date: datetime
+
+
+# -- Appointments
+class AppointmentCreate(BaseModel):
+    model_config = _strict_config
+
+    pet_id: int
+    veterinarian_id: int
+    appointment_date: datetime
+    reason: str
+    status: AppointmentStatus = 'scheduled'
+    notes: Optional[str] = None
+
+
+class AppointmentRead(AppointmentCreate):
+    model_config = _orm_config
+
+    appointment_id: int
+    created_at: datetime
+
+
+# -- Nested read schemas (require eager-loaded relationships)
+class OwnerWithPets(OwnerRead):
+    pets: List[PetRead] = []
+
+
+class PetWithAppointments(PetRead):
+    appointments: List[AppointmentRead] = []
@@ -1,200 +1,260 @@
-from datetime import date, datetime, timedelta
-from datetime import datetime, timedelta
-import random
-from decimal import Decimal
-
-from database import SessionLocal, engine
-import models
-from sqlalchemy.exc import IntegrityError
-
-
-def get_or_create_vet(db, data: dict):
-    # Prefer license_number, fall back to email
-    vet = None
-    if data.get('license_number'):
-        vet = db.query(models.Veterinarians).filter_by(license_number=data['license_number']).first()
-    if not vet and data.get('email'):
-        vet = db.query(models.Veterinarians).filter_by(email=data['email']).first()
-    if vet:
-        return vet
-    vet = models.Veterinarians(**data)
-    db.add(vet)
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        # likely a concurrent insert or unique violation; try to fetch existing
-        if data.get('license_number'):
-            vet = db.query(models.Veterinarians).filter_by(license_number=data['license_number']).first()
-        if not vet and data.get('email'):
-            vet = db.query(models.Veterinarians).filter_by(email=data['email']).first()
-        if vet:
-            return vet
-        raise
-    db.refresh(vet)
-    return vet
-
-
-def get_or_create_owner(db, data: dict):
-    # Owners are unique by email when available
-    owner = None
-    if data.get('email'):
-        owner = db.query(models.Owners).filter_by(email=data['email']).first()
-    if owner:
-        return owner
-    owner = models.Owners(**data)
-    db.add(owner)
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        if data.get('email'):
-            owner = db.query(models.Owners).filter_by(email=data['email']).first()
-        if owner:
-            return owner
-        raise
-    db.refresh(owner)
-    return owner
-
-
-def get_or_create_pet(db, data: dict):
-    # Use owner_id + name + birth_date as a reasonable uniqueness key for seeded pets
-    pet = db.query(models.Pets).filter_by(owner_id=data.get('owner_id'), name=data.get('name'), birth_date=data.get('birth_date')).first()
-    if pet:
-        return pet
-    pet = models.Pets(**data)
-    db.add(pet)
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        pet = db.query(models.Pets).filter_by(owner_id=data.get('owner_id'), name=data.get('name'), birth_date=data.get('birth_date')).first()
-        if pet:
-            return pet
-        raise
-    db.refresh(pet)
-    return pet
-
-
-def get_or_create_appointment(db, data: dict):
-    # Prevent duplicate appointments for the same pet/vet/datetime
-    appt = db.query(models.Appointments).filter_by(pet_id=data.get('pet_id'), veterinarian_id=data.get('veterinarian_id'), appointment_date=data.get('appointment_date')).first()
-    if appt:
-        return appt
-    appt = models.Appointments(**data)
-    db.add(appt)
-    try:
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        appt = db.query(models.Appointments).filter_by(pet_id=data.get('pet_id'), veterinarian_id=data.get('veterinarian_id'), appointment_date=data.get('appointment_date')).first()
-        if appt:
-            return appt
-        raise
-    db.refresh(appt)
-    return appt
-
-
-def seed():
-    """Populate the database with sample data for the veterinary schema.
-
-    Creates:
-    - 5 veterinarians
-    - 10 owners
-    - ~15 pets
-    - ~30 appointments (mix of scheduled, completed, cancelled)
-    """
-    # Ensure tables exist
-    models.Base.metadata.create_all(bind=engine)
-
-    db = SessionLocal()
-    try:
-        # ----- Veterinarians -----
-        vets_data = [
-            {"license_number": "VET-1001", "first_name": "Ana", "last_name": "Pérez", "email": "ana.perez@example.com", "specialization": "Surgery"},
-            {"license_number": "VET-1002", "first_name": "Luis", "last_name": "Martínez", "email": "luis.martinez@example.com", "specialization": "Dermatology"},
-            {"license_number": "VET-1003", "first_name": "María", "last_name": "González", "email": "maria.gonzalez@example.com", "specialization": "Dentistry"},
-            {"license_number": "VET-1004", "first_name": "Carlos", "last_name": "Ruiz", "email": "carlos.ruiz@example.com", "specialization": "Internal Medicine"},
-            {"license_number": "VET-1005", "first_name": "Elena", "last_name": "Soto", "email": "elena.soto@example.com", "specialization": "General"},
-        ]
-        vets = []
-        for v in vets_data:
-            obj = get_or_create_vet(db, v)
-            vets.append(obj)
-
-        # ----- Owners -----
-        owners = []
-        for i in range(1, 11):
-            odata = dict(
-                first_name=f"Owner{i}",
-                last_name="Seed",
-                email=f"owner{i}@example.com",
-                phone=f"+1-555-10{i:03d}",
-                address=f"Seed Ave {i}",
-            )
-            o = get_or_create_owner(db, odata)
-            owners.append(o)
-
-        # ----- Pets (~15) -----
-        pet_species = ["dog", "cat", "bird", "rabbit", "other"]
-        pets = []
-        for i in range(1, 16):
-            owner = random.choice(owners)
-            species = random.choice(pet_species)
-            birth_dt = (datetime.utcnow() - timedelta(days=random.randint(200, 4000))).date()
-            pdata = dict(
-                name=f"Pet{i}",
-                species=species,
-                breed="Mixed",
-                birth_date=birth_dt,
-                weight=Decimal(f"{random.uniform(1.5, 30.0):.2f}"),
-                owner_id=owner.owner_id,
-            )
-            p = get_or_create_pet(db, pdata)
-            pets.append(p)
-
-        # ----- Appointments (~30) -----
-        appointments = []
-        now = datetime.utcnow()
-        for i in range(30):
-            pet = random.choice(pets)
-            vet = random.choice(vets)
-
-            # Spread appointments +/- 20 days from now
-            offset_days = random.randint(-20, 20)
-            offset_minutes = random.choice([0, 15, 30, 45])
-            appt_dt = now + timedelta(days=offset_days, minutes=offset_minutes)
-
-            # Random status: scheduled (future), completed (past), cancelled
-            if appt_dt > now:
-                status = "scheduled"
-            else:
-                status = random.choices(["completed", "cancelled", "no_show"], weights=[0.7, 0.2, 0.1])[0]
-
-            appt_data = dict(
-                pet_id=pet.pet_id,
-                veterinarian_id=vet.veterinarian_id,
-                appointment_date=appt_dt,
-                reason=random.choice(["Checkup", "Vaccination", "Illness", "Grooming", "Follow-up"]),
-                status=status,
-                notes="Seeded appointment",
-            )
-            appt = get_or_create_appointment(db, appt_data)
-            appointments.append(appt)
-
-        db.commit()
-        for a in appointments:
-            db.refresh(a)
-
-        print(f"Seeded: {len(vets)} veterinarians, {len(owners)} owners, {len(pets)} pets, {len(appointments)} appointments")
-
-    except Exception as e:
-        print("Error while seeding:", e)
-        db.rollback()
-        raise
-    finally:
-        db.close()
-
-
-if __name__ == "__main__":
-    seed()
+from datetime import date, datetime, timedelta
+from datetime import datetime, timedelta
+import random
+from decimal import Decimal
+
+from database import SessionLocal, engine
+import models
+from sqlalchemy import inspect, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+
+def dec2(x):
+    """Two-decimal Decimal from a float, without formatting a string and
+    re-parsing it through Decimal's tokenizer."""
+    return Decimal(round(x * 100)).scaleb(-2)
+
+
+def get_or_create_vet(db, data: dict):
+    # Prefer license_number, fall back to email
+    vet = None
+    if data.get('license_number'):
+        vet = db.query(models.Veterinarians).filter_by(license_number=data['license_number']).first()
+    if not vet and data.get('email'):
+        vet = db.query(models.Veterinarians).filter_by(email=data['email']).first()
+    if vet:
+        return vet
+    # ON CONFLICT DO NOTHING instead of catching IntegrityError: a concurrent
+    # duplicate comes back as an empty RETURNING rather than an exception, so
+    # no SAVEPOINT/rollback is needed and the caller's transaction survives
+    # intact. RETURNING the full row keeps the result attribute-compatible
+    # with the ORM object the probe path returns.
+    row = db.execute(
+        pg_insert(models.Veterinarians)
+        .values(**data)
+        .on_conflict_do_nothing()
+        .returning(*models.Veterinarians.__table__.c)
+    ).first()
+    if row is not None:
+        return row
+    # a concurrent insert won the conflict; fetch the existing row
+    if data.get('license_number'):
+        vet = db.query(models.Veterinarians).filter_by(license_number=data['license_number']).first()
+    if not vet and data.get('email'):
+        vet = db.query(models.Veterinarians).filter_by(email=data['email']).first()
+    return vet
+
+
+def get_or_create_owner(db, data: dict):
+    # Owners are unique by email when available
+    owner = None
+    if data.get('email'):
+        owner = db.query(models.Owners).filter_by(email=data['email']).first()
+    if owner:
+        return owner
+    row = db.execute(
+        pg_insert(models.Owners)
+        .values(**data)
+        .on_conflict_do_nothing()
+        .returning(*models.Owners.__table__.c)
+    ).first()
+    if row is not None:
+        return row
+    return db.query(models.Owners).filter_by(email=data['email']).first()
+
+
+def get_or_create_pet(db, data: dict):
+    # Use owner_id + name + birth_date as a reasonable uniqueness key for seeded pets
+    pet = db.query(models.Pets).filter_by(owner_id=data.get('owner_id'), name=data.get('name'), birth_date=data.get('birth_date')).first()
+    if pet:
+        return pet
+    row = db.execute(
+        pg_insert(models.Pets)
+        .values(**data)
+        .on_conflict_do_nothing()
+        .returning(*models.Pets.__table__.c)
+    ).first()
+    if row is not None:
+        return row
+    return db.query(models.Pets).filter_by(owner_id=data.get('owner_id'), name=data.get('name'), birth_date=data.get('birth_date')).first()
+
+
+def get_or_create_appointment(db, data: dict):
+    # Prevent duplicate appointments for the same pet/vet/datetime
+    appt = db.query(models.Appointments).filter_by(pet_id=data.get('pet_id'), veterinarian_id=data.get('veterinarian_id'), appointment_date=data.get('appointment_date')).first()
+    if appt:
+        return appt
+    row = db.execute(
+        pg_insert(models.Appointments)
+        .values(**data)
+        .on_conflict_do_nothing()
+        .returning(*models.Appointments.__table__.c)
+    ).first()
+    if row is not None:
+        return row
+    return db.query(models.Appointments).filter_by(pet_id=data.get('pet_id'), veterinarian_id=data.get('veterinarian_id'), appointment_date=data.get('appointment_date')).first()
+
+
+def seed():
+    """Populate the database with sample data for the veterinary schema.
+
+    Creates:
+    - 5 veterinarians
+    - 10 owners
+    - ~15 pets
+    - ~30 appointments (mix of scheduled, completed, cancelled)
+    """
+    # Ensure tables exist.
+    # One existence probe instead of create_all checking pg_class per table
+    # on every run; the first run against an empty database still creates
+    # the full schema.
+    if not inspect(engine).has_table('veterinarians'):
+        models.Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        # ----- Veterinarians -----
+        vets_data = [
+            {"license_number": "VET-1001", "first_name": "Ana", "last_name": "Pérez", "email": "ana.perez@example.com", "specialization": "Surgery"},
+            {"license_number": "VET-1002", "first_name": "Luis", "last_name": "Martínez", "email": "luis.martinez@example.com", "specialization": "Dermatology"},
+            {"license_number": "VET-1003", "first_name": "María", "last_name": "González", "email": "maria.gonzalez@example.com", "specialization": "Dentistry"},
+            {"license_number": "VET-1004", "first_name": "Carlos", "last_name": "Ruiz", "email": "carlos.ruiz@example.com", "specialization": "Internal Medicine"},
+            {"license_number": "VET-1005", "first_name": "Elena", "last_name": "Soto", "email": "elena.soto@example.com", "specialization": "General"},
+        ]
+        # One multi-row INSERT per table instead of a SELECT+INSERT+COMMIT per
+        # row; duplicates are skipped by ON CONFLICT and, when any row
+        # conflicted, the full id list is fetched back with one SELECT.
+        vet_ids = [r[0] for r in db.execute(
+            pg_insert(models.Veterinarians)
+            .values(vets_data)
+            .on_conflict_do_nothing(index_elements=['license_number'])
+            .returning(models.Veterinarians.veterinarian_id)
+        )]
+        if len(vet_ids) < len(vets_data):
+            licenses = [v['license_number'] for v in vets_data]
+            vet_ids = [r[0] for r in db.execute(
+                select(models.Veterinarians.veterinarian_id)
+                .where(models.Veterinarians.license_number.in_(licenses))
+            )]
+
+        # ----- Owners -----
+        owners_data = [
+            dict(
+                first_name=f"Owner{i}",
+                last_name="Seed",
+                email=f"owner{i}@example.com",
+                phone=f"+1-555-10{i:03d}",
+                address=f"Seed Ave {i}",
+            )
+            for i in range(1, 11)
+        ]
+        owner_ids = [r[0] for r in db.execute(
+            pg_insert(models.Owners)
+            .values(owners_data)
+            .on_conflict_do_nothing(index_elements=['email'])
+            .returning(models.Owners.owner_id)
+        )]
+        if len(owner_ids) < len(owners_data):
+            emails = [o['email'] for o in owners_data]
+            owner_ids = [r[0] for r in db.execute(
+                select(models.Owners.owner_id)
+                .where(models.Owners.email.in_(emails))
+            )]
+
+        # ----- Pets (~15) -----
+        # uq_pet_owner_name_bd lets the INSERT target ON CONFLICT directly,
+        # like vets/owners above; no prefetch of existing keys needed.
+        #
+        # All randomness is drawn up front in per-column batches on a local
+        # Random instance: one choices()/listcomp per column instead of 4-6
+        # RNG calls (each taking the module-level lock) per row, and the seed
+        # makes re-runs reproducible.
+        rng = random.Random(42)
+        pet_species = ["dog", "cat", "bird", "rabbit", "other"]
+        pet_species_draw = rng.choices(pet_species, k=15)
+        birth_offsets = [rng.randint(200, 4000) for _ in range(15)]
+        weight_draw = [rng.uniform(1.5, 30.0) for _ in range(15)]
+        pet_owner_draw = rng.choices(owner_ids, k=15)
+        today = datetime.utcnow()
+        # Row building as comprehensions over the pre-drawn columns: no
+        # appends or RNG calls left in the hot part of the loop body.
+        pets_data = [
+            dict(
+                name=f"Pet{i}",
+                species=sp,
+                breed="Mixed",
+                birth_date=(today - timedelta(days=off)).date(),
+                weight=dec2(w),
+                owner_id=oid,
+            )
+            for i, (sp, off, w, oid) in enumerate(
+                zip(pet_species_draw, birth_offsets, weight_draw, pet_owner_draw), start=1
+            )
+        ]
+        pet_ids = [r[0] for r in db.execute(
+            pg_insert(models.Pets)
+            .values(pets_data)
+            .on_conflict_do_nothing(constraint='uq_pet_owner_name_bd')
+            .returning(models.Pets.pet_id)
+        )]
+        if len(pet_ids) < len(pets_data):
+            # refetch by the full identity key, not name alone: a pre-existing
+            # pet that merely shares a seeded name must not collect seeded
+            # appointments
+            keys = [(p['owner_id'], p['name'], p['birth_date']) for p in pets_data]
+            pet_ids = [r[0] for r in db.execute(
+                select(models.Pets.pet_id).where(
+                    tuple_(models.Pets.owner_id, models.Pets.name, models.Pets.birth_date).in_(keys)
+                )
+            )]
+
+        # ----- Appointments (~30) -----
+        # Deduped by uq_appt_pet_vet_date; ids come straight from the INSERT,
+        # so nothing needs refreshing afterwards.
+        now = datetime.utcnow()
+        # Spread appointments +/- 20 days from now; draws batched per column
+        # like the pets above
+        offset_days_draw = [rng.randint(-20, 20) for _ in range(30)]
+        offset_minutes_draw = rng.choices([0, 15, 30, 45], k=30)
+        reason_draw = rng.choices(["Checkup", "Vaccination", "Illness", "Grooming", "Follow-up"], k=30)
+        # status for past appointments: completed/cancelled/no_show
+        past_status_draw = rng.choices(["completed", "cancelled", "no_show"], weights=[0.7, 0.2, 0.1], k=30)
+        appt_pet_draw = rng.choices(pet_ids, k=30)
+        appt_vet_draw = rng.choices(vet_ids, k=30)
+        appt_dts = [
+            now + timedelta(days=od, minutes=om)
+            for od, om in zip(offset_days_draw, offset_minutes_draw)
+        ]
+        appts_data = [
+            dict(
+                pet_id=pid,
+                veterinarian_id=vid,
+                appointment_date=dt,
+                reason=reason,
+                status="scheduled" if dt > now else past_status,
+                notes="Seeded appointment",
+            )
+            for dt, reason, past_status, pid, vid in zip(
+                appt_dts, reason_draw, past_status_draw, appt_pet_draw, appt_vet_draw,
+            )
+        ]
+        db.execute(
+            pg_insert(models.Appointments)
+            .values(appts_data)
+            .on_conflict_do_nothing(constraint='uq_appt_pet_vet_date')
+        )
+
+        db.commit()
+
+        print(f"Seeded: {len(vet_ids)} veterinarians, {len(owner_ids)} owners, {len(pet_ids)} pets, {len(appts_data)} appointments")
+
+    except Exception as e:
+        print("Error while seeding:", e)
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    seed()
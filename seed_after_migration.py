@@ -1,163 +1,238 @@
-import argparse
-from datetime import datetime, timedelta
-import random
-from decimal import Decimal
-
-from database import SessionLocal, engine
-import models
-from seed import get_or_create_vet, get_or_create_owner, get_or_create_pet, get_or_create_appointment
-import sys
-
-
-def preflight_check(db):
-    """Run quick DB checks and report existing row counts for key tables.
-
-    Returns a dict with counts or raises an informative error on failure.
-    """
-    try:
-        vets_count = db.query(models.Veterinarians).count()
-        owners_count = db.query(models.Owners).count()
-        pets_count = db.query(models.Pets).count()
-        appts_count = db.query(models.Appointments).count()
-    except Exception as e:
-        raise RuntimeError(f"DB preflight failed: {e}") from e
-
-    counts = {
-        'veterinarians': vets_count,
-        'owners': owners_count,
-        'pets': pets_count,
-        'appointments': appts_count,
-    }
-    print("Preflight counts:")
-    for k, v in counts.items():
-        print(f"  {k}: {v}")
-    if any(v > 0 for v in counts.values()):
-        print("Warning: database already contains data. Re-running seed may create duplicates but the script uses get_or_create helpers to avoid exact duplicates based on keys.")
-    return counts
-
-
-def seed_after(migration: int = 0):
-    """Seed additional data after migrations. If migration >=5, also populate metrics (ratings/fees)."""
-    models.Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-    try:
-        # smaller batch of data
-        vets = []
-        for i in range(1, 3):
-            vdata = dict(
-                license_number=f"VET-M{migration}-{i}",
-                first_name=f"Post{i}",
-                last_name="Migration",
-                email=f"post_mig{migration}_vet{i}@example.com",
-                specialization=random.choice(["General", "Surgery", "Dentistry"]),
-            )
-            vets.append(get_or_create_vet(db, vdata))
-
-        owners = []
-        for i in range(1, 6):
-            odata = dict(
-                first_name=f"PostOwner{i}",
-                last_name="Migration",
-                email=f"post_mig{migration}_owner{i}@example.com",
-                phone=f"+1-555-30{i:03d}",
-                address=f"Post Migration St {i}",
-            )
-            owners.append(get_or_create_owner(db, odata))
-
-        pets = []
-        species = ["dog", "cat", "bird", "rabbit", "other"]
-        for i in range(1, 11):
-            owner = random.choice(owners)
-            birth_dt = (datetime.utcnow() - timedelta(days=random.randint(365, 3000))).date()
-            pdata = dict(
-                name=f"PostPet{migration}-{i}",
-                species=random.choice(species),
-                breed="Mixed",
-                birth_date=birth_dt,
-                weight=Decimal(f"{random.uniform(1.0, 40.0):.2f}"),
-                owner_id=owner.owner_id,
-            )
-            pets.append(get_or_create_pet(db, pdata))
-
-        appointments = []
-        now = datetime.utcnow()
-        for i in range(20):
-            pet = random.choice(pets)
-            vet = random.choice(vets)
-            offset_days = random.randint(-60, 30)
-            offset_minutes = random.choice([0, 15, 30, 45])
-            appt_dt = now + timedelta(days=offset_days, minutes=offset_minutes)
-            status = "scheduled" if appt_dt > now else random.choices(["completed", "cancelled", "no_show"], weights=[0.8, 0.15, 0.05])[0]
-            adata = dict(
-                pet_id=pet.pet_id,
-                veterinarian_id=vet.veterinarian_id,
-                appointment_date=appt_dt,
-                reason=random.choice(["Checkup", "Vaccination", "Illness", "Grooming"]),
-                status=status,
-                notes=f"Post-migration {migration} seeded appointment",
-            )
-            appointments.append(get_or_create_appointment(db, adata))
-
-        db.commit()
-
-        # If migration 5 or newer, populate metrics similar to migration 0005
-        if migration >= 5:
-            conn = db.connection()
-            # total_appointments
-            conn.execute(
-                "UPDATE veterinarians v SET total_appointments = sub.cnt FROM (SELECT veterinarian_id, COUNT(*) AS cnt FROM appointments WHERE status = 'completed' GROUP BY veterinarian_id) sub WHERE v.veterinarian_id = sub.veterinarian_id"
-            )
-            # consultation_fee
-            conn.execute(
-                "UPDATE veterinarians v SET consultation_fee = COALESCE(sub.avg_total, 0.00)::numeric(8,2) FROM (SELECT a.veterinarian_id, AVG(i.total_amount) AS avg_total FROM appointments a JOIN invoices i ON i.appointment_id = a.appointment_id GROUP BY a.veterinarian_id) sub WHERE v.veterinarian_id = sub.veterinarian_id"
-            )
-            # rating - synthesize a rating between 3.0 and 5.0 for vets with activity
-            vets_all = db.query(models.Veterinarians).all()
-            for v in vets_all:
-                if getattr(v, 'total_appointments', 0) > 0:
-                    # random rating
-                    v.rating = Decimal(f"{random.uniform(3.0, 5.0):.2f}")
-            db.commit()
-
-            # pets metrics
-            conn.execute(
-                "UPDATE pets p SET visit_count = sub.cnt, last_visit_date = sub.lastv FROM (SELECT pet_id, COUNT(*) AS cnt, MAX(appointment_date)::date AS lastv FROM appointments WHERE status = 'completed' GROUP BY pet_id) sub WHERE p.pet_id = sub.pet_id"
-            )
-            db.commit()
-
-        print(f"Post-migration ({migration}) seed: {len(vets)} vets, {len(owners)} owners, {len(pets)} pets, {len(appointments)} appointments")
-
-    except Exception as e:
-        print("Error during post-migration seed:", e)
-        db.rollback()
-        raise
-    finally:
-        db.close()
-
-
-def main():
-    parser = argparse.ArgumentParser(description='Seed additional data after migration')
-    parser.add_argument('--migration', type=int, default=0, help='Migration number (e.g., 5)')
-    parser.add_argument('--yes', action='store_true', help='Proceed even if DB already has data')
-    args = parser.parse_args()
-
-    # preflight
-    db = SessionLocal()
-    try:
-        counts = preflight_check(db)
-    except Exception as e:
-        print(e)
-        db.close()
-        sys.exit(1)
-
-    if not args.yes and any(v > 0 for v in counts.values()):
-        print("Aborting: DB already contains data. Rerun with --yes to force post-migration seeding.")
-        db.close()
-        sys.exit(0)
-    db.close()
-
-    seed_after(args.migration)
-
-
-if __name__ == '__main__':
-    main()
+import argparse
+from datetime import datetime, timedelta
+import random
+
+from database import SessionLocal, engine
+import models
+from psycopg2.extras import execute_values
+from sqlalchemy import inspect, select, text
+from seed import dec2, get_or_create_vet, get_or_create_owner, get_or_create_pet
+import sys
+
+
+def preflight_check(db):
+    """Run quick DB checks and report existing row counts for key tables.
+
+    Returns a dict with counts or raises an informative error on failure.
+    """
+    try:
+        # one round-trip for all four counts instead of four COUNT(*) queries
+        row = db.execute(text(
+            "SELECT (SELECT count(*) FROM veterinarians), "
+            "(SELECT count(*) FROM owners), "
+            "(SELECT count(*) FROM pets), "
+            "(SELECT count(*) FROM appointments)"
+        )).one()
+    except Exception as e:
+        raise RuntimeError(f"DB preflight failed: {e}") from e
+
+    counts = {
+        'veterinarians': row[0],
+        'owners': row[1],
+        'pets': row[2],
+        'appointments': row[3],
+    }
+    print("Preflight counts:")
+    for k, v in counts.items():
+        print(f"  {k}: {v}")
+    if any(v > 0 for v in counts.values()):
+        print("Warning: database already contains data. Re-running seed may create duplicates but the script uses get_or_create helpers to avoid exact duplicates based on keys.")
+    return counts
+
+
+def seed_after(migration: int = 0, db=None):
+    """Seed additional data after migrations. If migration >=5, also populate metrics (ratings/fees).
+
+    Accepts an existing session (e.g. the one preflight_check already
+    opened) so a run pays one connection setup instead of two; a session
+    created here is also closed here.
+    """
+    # One existence probe instead of create_all checking pg_class per table
+    # on every run; the first run against an empty database still creates
+    # the full schema.
+    if not inspect(engine).has_table('veterinarians'):
+        models.Base.metadata.create_all(bind=engine)
+    owns_session = db is None
+    if owns_session:
+        db = SessionLocal()
+    try:
+        # The migration number is interpolated into every faux-unique key;
+        # doing it once per prefix leaves plain concatenation in the loops
+        # instead of a full f-string format per row.
+        vet_license_prefix = f"VET-M{migration}-"
+        vet_email_prefix = f"post_mig{migration}_vet"
+        owner_email_prefix = f"post_mig{migration}_owner"
+        pet_name_prefix = f"PostPet{migration}-"
+        appt_note = f"Post-migration {migration} seeded appointment"
+
+        # smaller batch of data
+        vets = []
+        for i in range(1, 3):
+            vdata = dict(
+                license_number=vet_license_prefix + str(i),
+                first_name=f"Post{i}",
+                last_name="Migration",
+                email=vet_email_prefix + str(i) + "@example.com",
+                specialization=random.choice(["General", "Surgery", "Dentistry"]),
+            )
+            vets.append(get_or_create_vet(db, vdata))
+
+        owners = []
+        for i in range(1, 6):
+            odata = dict(
+                first_name=f"PostOwner{i}",
+                last_name="Migration",
+                email=owner_email_prefix + str(i) + "@example.com",
+                phone=f"+1-555-30{i:03d}",
+                address=f"Post Migration St {i}",
+            )
+            owners.append(get_or_create_owner(db, odata))
+
+        # Capture the PKs as plain ints once: sampling ints avoids touching
+        # ORM instance state per row (and any reload that expired attribute
+        # access could trigger).
+        vet_ids = [v.veterinarian_id for v in vets]
+        owner_ids = [o.owner_id for o in owners]
+
+        # one clock read for the whole batch: relative dates stay consistent
+        # across rows and no per-row syscall
+        now = datetime.utcnow()
+        pets = []
+        species = ["dog", "cat", "bird", "rabbit", "other"]
+        for i in range(1, 11):
+            birth_dt = (now - timedelta(days=random.randint(365, 3000))).date()
+            pdata = dict(
+                name=pet_name_prefix + str(i),
+                species=random.choice(species),
+                breed="Mixed",
+                birth_date=birth_dt,
+                weight=dec2(random.uniform(1.0, 40.0)),
+                owner_id=random.choice(owner_ids),
+            )
+            pets.append(get_or_create_pet(db, pdata))
+        pet_ids = [p.pet_id for p in pets]
+
+        # parents must be committed before the raw-connection insert below
+        # can see them for its FK checks
+        db.commit()
+
+        # Appointments skip the ORM entirely: psycopg2's execute_values sends
+        # one multi-row VALUES statement over a raw connection — a single
+        # parse and a single network packet. Idempotency comes from the same
+        # prefetch-and-diff used elsewhere, with a targetless ON CONFLICT
+        # DO NOTHING as the race backstop.
+        appt_rows = []
+        for i in range(20):
+            offset_days = random.randint(-60, 30)
+            offset_minutes = random.choice([0, 15, 30, 45])
+            appt_dt = now + timedelta(days=offset_days, minutes=offset_minutes)
+            status = "scheduled" if appt_dt > now else random.choices(["completed", "cancelled", "no_show"], weights=[0.8, 0.15, 0.05])[0]
+            appt_rows.append((
+                random.choice(pet_ids),
+                random.choice(vet_ids),
+                appt_dt,
+                random.choice(["Checkup", "Vaccination", "Illness", "Grooming"]),
+                status,
+                appt_note,
+            ))
+        existing_appts = {
+            (r[0], r[1], r[2])
+            for r in db.execute(select(
+                models.Appointments.pet_id,
+                models.Appointments.veterinarian_id,
+                models.Appointments.appointment_date,
+            ))
+        }
+        missing_appts = [r for r in appt_rows if (r[0], r[1], r[2]) not in existing_appts]
+        if missing_appts:
+            raw = engine.raw_connection()
+            try:
+                cur = raw.cursor()
+                try:
+                    execute_values(
+                        cur,
+                        "INSERT INTO appointments (pet_id, veterinarian_id, appointment_date, reason, status, notes) "
+                        "VALUES %s ON CONFLICT ON CONSTRAINT uq_appt_pet_vet_date DO NOTHING",
+                        missing_appts,
+                        page_size=1000,
+                    )
+                finally:
+                    cur.close()
+                raw.commit()
+            finally:
+                raw.close()
+
+        # If migration 5 or newer, populate metrics similar to migration 0005
+        if migration >= 5:
+            conn = db.connection()
+            # One pass over appointments for every metric: a GROUPING SETS
+            # aggregate materializes the per-vet and per-pet rollups into a
+            # temp table, and the UPDATEs below read from that instead of
+            # each re-scanning (and re-joining) appointments.
+            conn.execute(text(
+                "CREATE TEMP TABLE appt_metrics ON COMMIT DROP AS "
+                "SELECT a.veterinarian_id, a.pet_id, "
+                "COUNT(*) FILTER (WHERE a.status = 'completed') AS completed_cnt, "
+                "AVG(i.total_amount) AS avg_total, "
+                "(MAX(a.appointment_date) FILTER (WHERE a.status = 'completed'))::date AS last_visit "
+                "FROM appointments a LEFT JOIN invoices i ON i.appointment_id = a.appointment_id "
+                "GROUP BY GROUPING SETS ((a.veterinarian_id), (a.pet_id))"
+            ))
+            # total_appointments + consultation_fee in one UPDATE; vets with
+            # no invoiced appointments keep their current fee
+            conn.execute(text(
+                "UPDATE veterinarians v SET total_appointments = m.completed_cnt, "
+                "consultation_fee = COALESCE(m.avg_total::numeric(8,2), v.consultation_fee) "
+                "FROM appt_metrics m WHERE m.veterinarian_id = v.veterinarian_id"
+            ))
+            # rating - synthesize a rating between 3.0 and 5.0 for vets with
+            # activity; one set-based UPDATE with server-side random() instead
+            # of loading every vet and flushing N single-row UPDATEs
+            conn.execute(text(
+                "UPDATE veterinarians SET rating = ROUND((3.0 + random() * 2.0)::numeric, 2) "
+                "WHERE total_appointments > 0"
+            ))
+            # pets metrics from the same rollup
+            conn.execute(text(
+                "UPDATE pets p SET visit_count = m.completed_cnt, last_visit_date = m.last_visit "
+                "FROM appt_metrics m WHERE m.pet_id = p.pet_id"
+            ))
+            db.commit()
+
+        print(f"Post-migration ({migration}) seed: {len(vets)} vets, {len(owners)} owners, {len(pets)} pets, {len(appt_rows)} appointments")
+
+    except Exception as e:
+        print("Error during post-migration seed:", e)
+        db.rollback()
+        raise
+    finally:
+        if owns_session:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed additional data after migration')
+    parser.add_argument('--migration', type=int, default=0, help='Migration number (e.g., 5)')
+    parser.add_argument('--yes', action='store_true', help='Proceed even if DB already has data')
+    args = parser.parse_args()
+
+    # preflight and seed share one session: one connect/auth per run
+    db = SessionLocal()
+    try:
+        try:
+            counts = preflight_check(db)
+        except Exception as e:
+            print(e)
+            sys.exit(1)
+
+        if not args.yes and any(v > 0 for v in counts.values()):
+            print("Aborting: DB already contains data. Rerun with --yes to force post-migration seeding.")
+            sys.exit(0)
+
+        seed_after(args.migration, db=db)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
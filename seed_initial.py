@@ -1,134 +1,261 @@
-from datetime import datetime, timedelta
-import random
-from decimal import Decimal
-
-from database import SessionLocal, engine
-import models
-from seed import get_or_create_vet, get_or_create_owner, get_or_create_pet, get_or_create_appointment
-import sys
-import argparse
-
-
-def preflight_check(db):
-    """Run quick DB checks and report existing row counts for key tables.
-
-    Returns a dict with counts or raises an informative error on failure.
-    """
-    try:
-        vets_count = db.query(models.Veterinarians).count()
-        owners_count = db.query(models.Owners).count()
-        pets_count = db.query(models.Pets).count()
-        appts_count = db.query(models.Appointments).count()
-    except Exception as e:
-        raise RuntimeError(f"DB preflight failed: {e}") from e
-
-    counts = {
-        'veterinarians': vets_count,
-        'owners': owners_count,
-        'pets': pets_count,
-        'appointments': appts_count,
-    }
-    print("Preflight counts:")
-    for k, v in counts.items():
-        print(f"  {k}: {v}")
-    if any(v > 0 for v in counts.values()):
-        print("Warning: database already contains data. Re-running seed may create duplicates but the script uses get_or_create helpers to avoid exact duplicates based on keys.")
-    return counts
-
-
-def seed_initial():
-    """Seed initial dataset: 10 veterinarians, 20 owners, 30 pets, 50 appointments."""
-    models.Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-    try:
-        vets = []
-        for i in range(1, 11):
-            vdata = dict(
-                license_number=f"VET-2{i:03d}",
-                first_name=f"Vet{i}",
-                last_name="Seed",
-                email=f"vet{i}@example.com",
-                specialization=random.choice(["General", "Surgery", "Dentistry", "Dermatology", "Internal Medicine"]),
-            )
-            vets.append(get_or_create_vet(db, vdata))
-
-        owners = []
-        for i in range(1, 21):
-            odata = dict(
-                first_name=f"Owner{i}",
-                last_name="Initial",
-                email=f"initial_owner{i}@example.com",
-                phone=f"+1-555-20{i:03d}",
-                address=f"Initial St {i}",
-            )
-            owners.append(get_or_create_owner(db, odata))
-
-        pets = []
-        species = ["dog", "cat", "bird", "rabbit", "other"]
-        for i in range(1, 31):
-            owner = random.choice(owners)
-            birth_dt = (datetime.utcnow() - timedelta(days=random.randint(365, 4000))).date()
-            pdata = dict(
-                name=f"InitPet{i}",
-                species=random.choice(species),
-                breed="Mixed",
-                birth_date=birth_dt,
-                weight=Decimal(f"{random.uniform(1.0, 40.0):.2f}"),
-                owner_id=owner.owner_id,
-            )
-            pets.append(get_or_create_pet(db, pdata))
-
-        appointments = []
-        now = datetime.utcnow()
-        for i in range(50):
-            pet = random.choice(pets)
-            vet = random.choice(vets)
-            offset_days = random.randint(-90, 30)
-            offset_minutes = random.choice([0, 15, 30, 45])
-            appt_dt = now + timedelta(days=offset_days, minutes=offset_minutes)
-            status = "scheduled" if appt_dt > now else random.choices(["completed", "cancelled", "no_show"], weights=[0.75, 0.15, 0.10])[0]
-            adata = dict(
-                pet_id=pet.pet_id,
-                veterinarian_id=vet.veterinarian_id,
-                appointment_date=appt_dt,
-                reason=random.choice(["Checkup", "Vaccination", "Illness", "Grooming", "Follow-up"]),
-                status=status,
-                notes="Initial seed appointment",
-            )
-            appointments.append(get_or_create_appointment(db, adata))
-
-        print(f"Initial seed: {len(vets)} vets, {len(owners)} owners, {len(pets)} pets, {len(appointments)} appointments")
-
-    except Exception as e:
-        print("Error during initial seed:", e)
-        db.rollback()
-        raise
-    finally:
-        db.close()
-
-
-def main():
-    parser = argparse.ArgumentParser(description='Run initial seed dataset')
-    parser.add_argument('--yes', action='store_true', help='Proceed even if DB already has data')
-    args = parser.parse_args()
-
-    # preflight
-    db = SessionLocal()
-    try:
-        counts = preflight_check(db)
-    except Exception as e:
-        print(e)
-        db.close()
-        sys.exit(1)
-
-    if not args.yes and any(v > 0 for v in counts.values()):
-        print("Aborting: DB already contains data. Rerun with --yes to force seeding.")
-        db.close()
-        sys.exit(0)
-    db.close()
-
-    seed_initial()
-
-
-if __name__ == "__main__":
-    main()
+import csv
+from datetime import datetime, timedelta
+import io
+import random
+
+from database import SessionLocal, engine
+import models
+from seed import dec2
+from sqlalchemy import inspect, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import sys
+import argparse
+
+
+def _copy_rows(db, table, columns, rows):
+    """Stream row dicts into a table with COPY ... FROM STDIN (PostgreSQL only).
+
+    COPY bypasses the SQL parser/planner per row, so it scales much better
+    than multi-row INSERT once the seed constants are raised into the
+    thousands. Runs on the session's own connection, so it commits (or rolls
+    back) together with everything else in the transaction.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+    buf.seek(0)
+    cur = db.connection().connection.cursor()
+    try:
+        cur.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buf,
+        )
+    finally:
+        cur.close()
+
+
+def preflight_check(db):
+    """Run quick DB checks and report existing row counts for key tables.
+
+    Returns a dict with counts or raises an informative error on failure.
+    """
+    try:
+        # one round-trip for all four counts instead of four COUNT(*) queries
+        row = db.execute(text(
+            "SELECT (SELECT count(*) FROM veterinarians), "
+            "(SELECT count(*) FROM owners), "
+            "(SELECT count(*) FROM pets), "
+            "(SELECT count(*) FROM appointments)"
+        )).one()
+    except Exception as e:
+        raise RuntimeError(f"DB preflight failed: {e}") from e
+
+    counts = {
+        'veterinarians': row[0],
+        'owners': row[1],
+        'pets': row[2],
+        'appointments': row[3],
+    }
+    print("Preflight counts:")
+    for k, v in counts.items():
+        print(f"  {k}: {v}")
+    if any(v > 0 for v in counts.values()):
+        print("Warning: database already contains data. Re-running seed may create duplicates but the script uses get_or_create helpers to avoid exact duplicates based on keys.")
+    return counts
+
+
+def seed_initial(bulk=False, db=None):
+    """Seed initial dataset: 10 veterinarians, 20 owners, 30 pets, 50 appointments.
+
+    With bulk=True (and a PostgreSQL backend) pets and appointments are
+    streamed with COPY instead of INSERT; parent tables stay on
+    INSERT ... RETURNING because their ids are needed up front.
+    Accepts an existing session (e.g. the one preflight_check already
+    opened) so a run pays one connection setup instead of two; a session
+    created here is also closed here.
+    """
+    # One existence probe instead of create_all checking pg_class per table
+    # on every run; the first run against an empty database still creates
+    # the full schema.
+    if not inspect(engine).has_table('veterinarians'):
+        models.Base.metadata.create_all(bind=engine)
+    owns_session = db is None
+    if owns_session:
+        db = SessionLocal()
+    try:
+        # Bulk path throughout: build the row dicts first, then one multi-row
+        # INSERT per table instead of a SELECT+INSERT per row.
+        vets_data = [
+            dict(
+                license_number=f"VET-2{i:03d}",
+                first_name=f"Vet{i}",
+                last_name="Seed",
+                email=f"vet{i}@example.com",
+                specialization=random.choice(["General", "Surgery", "Dentistry", "Dermatology", "Internal Medicine"]),
+            )
+            for i in range(1, 11)
+        ]
+        vet_ids = [r[0] for r in db.execute(
+            pg_insert(models.Veterinarians)
+            .values(vets_data)
+            .on_conflict_do_nothing(index_elements=['license_number'])
+            .returning(models.Veterinarians.veterinarian_id)
+        )]
+        if len(vet_ids) < len(vets_data):
+            licenses = [v['license_number'] for v in vets_data]
+            vet_ids = [r[0] for r in db.execute(
+                select(models.Veterinarians.veterinarian_id)
+                .where(models.Veterinarians.license_number.in_(licenses))
+            )]
+
+        owners_data = [
+            dict(
+                first_name=f"Owner{i}",
+                last_name="Initial",
+                email=f"initial_owner{i}@example.com",
+                phone=f"+1-555-20{i:03d}",
+                address=f"Initial St {i}",
+            )
+            for i in range(1, 21)
+        ]
+        owner_ids = [r[0] for r in db.execute(
+            pg_insert(models.Owners)
+            .values(owners_data)
+            .on_conflict_do_nothing(index_elements=['email'])
+            .returning(models.Owners.owner_id)
+        )]
+        if len(owner_ids) < len(owners_data):
+            emails = [o['email'] for o in owners_data]
+            owner_ids = [r[0] for r in db.execute(
+                select(models.Owners.owner_id)
+                .where(models.Owners.email.in_(emails))
+            )]
+
+        # Pets and appointments dedupe through their composite unique keys,
+        # except on the COPY path, which has no ON CONFLICT and so keeps the
+        # prefetch-and-diff of existing keys.
+        species = ["dog", "cat", "bird", "rabbit", "other"]
+        # one clock read for the whole batch: relative dates stay consistent
+        # across rows and no per-row syscall
+        now = datetime.utcnow()
+        pets_data = []
+        for i in range(1, 31):
+            birth_dt = (now - timedelta(days=random.randint(365, 4000))).date()
+            pets_data.append(dict(
+                name=f"InitPet{i}",
+                species=random.choice(species),
+                breed="Mixed",
+                birth_date=birth_dt,
+                weight=dec2(random.uniform(1.0, 40.0)),
+                owner_id=random.choice(owner_ids),
+            ))
+        pet_ids = []
+        if bulk and engine.dialect.name == 'postgresql':
+            existing_pets = {
+                (r[0], r[1], r[2])
+                for r in db.execute(select(models.Pets.owner_id, models.Pets.name, models.Pets.birth_date))
+            }
+            missing_pets = [
+                p for p in pets_data
+                if (p['owner_id'], p['name'], p['birth_date']) not in existing_pets
+            ]
+            if missing_pets:
+                _copy_rows(db, 'pets',
+                           ['name', 'species', 'breed', 'birth_date', 'weight', 'owner_id'],
+                           missing_pets)
+        else:
+            pet_ids = [r[0] for r in db.execute(
+                pg_insert(models.Pets)
+                .values(pets_data)
+                .on_conflict_do_nothing(constraint='uq_pet_owner_name_bd')
+                .returning(models.Pets.pet_id)
+            )]
+        if len(pet_ids) < len(pets_data):
+            # refetch by the full identity key, not name alone; see seed.py
+            keys = [(p['owner_id'], p['name'], p['birth_date']) for p in pets_data]
+            pet_ids = [r[0] for r in db.execute(
+                select(models.Pets.pet_id).where(
+                    tuple_(models.Pets.owner_id, models.Pets.name, models.Pets.birth_date).in_(keys)
+                )
+            )]
+
+        appts_data = []
+        for i in range(50):
+            offset_days = random.randint(-90, 30)
+            offset_minutes = random.choice([0, 15, 30, 45])
+            appt_dt = now + timedelta(days=offset_days, minutes=offset_minutes)
+            status = "scheduled" if appt_dt > now else random.choices(["completed", "cancelled", "no_show"], weights=[0.75, 0.15, 0.10])[0]
+            appts_data.append(dict(
+                pet_id=random.choice(pet_ids),
+                veterinarian_id=random.choice(vet_ids),
+                appointment_date=appt_dt,
+                reason=random.choice(["Checkup", "Vaccination", "Illness", "Grooming", "Follow-up"]),
+                status=status,
+                notes="Initial seed appointment",
+            ))
+        if bulk and engine.dialect.name == 'postgresql':
+            existing_appts = {
+                (r[0], r[1], r[2])
+                for r in db.execute(select(
+                    models.Appointments.pet_id,
+                    models.Appointments.veterinarian_id,
+                    models.Appointments.appointment_date,
+                ))
+            }
+            missing_appts = [
+                a for a in appts_data
+                if (a['pet_id'], a['veterinarian_id'], a['appointment_date']) not in existing_appts
+            ]
+            if missing_appts:
+                _copy_rows(db, 'appointments',
+                           ['pet_id', 'veterinarian_id', 'appointment_date', 'reason', 'status', 'notes'],
+                           missing_appts)
+        else:
+            db.execute(
+                pg_insert(models.Appointments)
+                .values(appts_data)
+                .on_conflict_do_nothing(constraint='uq_appt_pet_vet_date')
+            )
+
+        # single COMMIT for the whole dataset: one WAL fsync instead of one
+        # per row
+        db.commit()
+
+        print(f"Initial seed: {len(vet_ids)} vets, {len(owner_ids)} owners, {len(pet_ids)} pets, {len(appts_data)} appointments")
+
+    except Exception as e:
+        print("Error during initial seed:", e)
+        db.rollback()
+        raise
+    finally:
+        if owns_session:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run initial seed dataset')
+    parser.add_argument('--yes', action='store_true', help='Proceed even if DB already has data')
+    parser.add_argument('--bulk', action='store_true', help='Stream pets/appointments with COPY (PostgreSQL only); faster once the dataset grows past a few thousand rows')
+    args = parser.parse_args()
+
+    # preflight and seed share one session: one connect/auth per run
+    db = SessionLocal()
+    try:
+        try:
+            counts = preflight_check(db)
+        except Exception as e:
+            print(e)
+            sys.exit(1)
+
+        if not args.yes and any(v > 0 for v in counts.values()):
+            print("Aborting: DB already contains data. Rerun with --yes to force seeding.")
+            sys.exit(0)
+
+        seed_initial(bulk=args.bulk, db=db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()